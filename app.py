@@ -1,222 +1,258 @@
 
-import pandas as pd
+import io
+import threading
+import time
+
 import streamlit as st
-import sqlite3
+from PIL import Image
+
+from catalog import DEFAULT_CONCRETE_CLASS, NEAREST_HEIGHT_TOLERANCE, VENDORS, cache_stats
+from display import format_dataframe
+from engine import SearchEngine
+from export import available_formats, export_bytes, export_mime, export_name
+from metrics import PROFILE_ENABLED, enabled as metrics_enabled, recent, span, start_metrics_server, start_profile, stop_profile, summary
+from query_cache import query_cache
+from search import parse_model_numbers, read_bom_file
+
+# Optional instrumentation (metrics.py): with PRODUCT_FINDER_METRICS=1 the
+# Performance panel in the sidebar lists the spans of each run of the search
+# section, and with PRODUCT_FINDER_PROFILE=1 those runs can be traced with
+# cProfile. Searches rerun as a fragment, so the fragment profiles itself and
+# redraws the panel through a placeholder created here.
+start_metrics_server()
+profile_reruns = PROFILE_ENABLED and st.sidebar.checkbox("Profile search reruns", key="profile-rerun")
+performance_panel = st.sidebar.empty() if metrics_enabled() or PROFILE_ENABLED else None
+
+# The logo PNG is 2372 px wide and 880 KB. It is downscaled once per process
+# to twice the page width and re-encoded as JPEG (it has no transparency),
+# so full reruns reference a ~40 KB cached image.
+LOGO_WIDTH = 1400
+
+@st.cache_resource
+def load_logo(path="Logos.png", width=LOGO_WIDTH):
+    with Image.open(path) as logo:
+        logo = logo.convert("RGB").resize((width, round(logo.height * width / logo.width)), Image.LANCZOS)
+    out = io.BytesIO()
+    logo.save(out, format="JPEG", quality=85, optimize=True)
+    return out.getvalue()
 
 # Display logo and author names
-st.image("Logos.png", use_column_width=True)
+st.image(load_logo(), width="stretch")
 st.write("### Gabriel D. Guerra and Nikita G. Meshin")
 st.title("Product Finder App")
 
 # Example model numbers
 st.write("## Examples of Model Number Format:")
 
-col1, col2 = st.columns(2)
-
-with col1:
-    st.write("### Schöck Example:")
-    st.write("T-K-M9-VV1-REI120-CV35-X80-H200-6.2")
-
-with col2:
-    st.write("### Halfen/Leviat Example:")
-    st.write("HIT_SP-MVX-1407-16-100-35")
-
-# Load data from SQLite database
-db_path = "masterfile.db"
-
-def load_data(query):
-    conn = sqlite3.connect(db_path)
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
-
-df_Schoeck = load_data("SELECT * FROM updated_Isokorb_T_full_columns")
-df_XT = load_data("SELECT * FROM updated_Isokorb_XT_full_columns")
-df_Schoeck = pd.concat([df_Schoeck, df_XT], ignore_index=True)
-
-df_Leviat_HP = load_data("SELECT * FROM final_file_extended_columns_HIT_HP")
-df_Leviat_SP = load_data("SELECT * FROM final_file_extended_columns_HIT_SP")
-df_Leviat = pd.concat([df_Leviat_HP, df_Leviat_SP], ignore_index=True)
-
-# Preprocessing functions
-def preprocess_additional_file(df_Leviat):
-    filtered_df = df_Leviat[df_Leviat['c'] == "25/30"].copy()
-    filtered_df['mRd_minus'] = filtered_df['mRd_minus'].astype(str).str.replace(',', '.').str.replace('-', '').astype(float)
-    filtered_df['vRd_plus'] = filtered_df['vRd_plus'].astype(str).str.replace(',', '.').str.replace('-', '').astype(float)
-    return filtered_df
-
-def preprocess_schoeck_file(df_Schoeck):
-    df_Schoeck['mRd'] = df_Schoeck['mRd'].astype(str).str.replace(',', '.').str.replace('±', '').str.replace('-', '0').astype(float)
-    df_Schoeck['vRd'] = df_Schoeck['vRd'].astype(str).str.replace(',', '.').str.replace('±', '').str.replace('-', '0').astype(float)
-    return df_Schoeck
-
-df_Schoeck = preprocess_schoeck_file(df_Schoeck)
-
-# Functions to fetch specifications by model number
-def fetch_specs_by_model_schoeck(df_Schoeck, product_name):
-    specific_product = df_Schoeck[df_Schoeck['product_name'] == product_name]
-    if specific_product.empty:
-        return None, None, None
-    mrd_value = specific_product['mRd'].values[0]
-    vrd_value = specific_product['vRd'].values[0]
-    height_value = int(product_name.split('-')[7][1:])  # Extract height from model number
-    return mrd_value, vrd_value, height_value
-
-def fetch_specs_by_model_leviat(df_Leviat, encoded_value):
-    preprocessed_df = preprocess_additional_file(df_Leviat)
-    specific_products = preprocessed_df[preprocessed_df['product_name'] == encoded_value]
-    if specific_products.empty:
-        return None, None, None, None, None
-    mrd_values = specific_products['mRd_minus'].values
-    vrd_values = specific_products['vRd_plus'].values
-    height_value = specific_products['hh'].values[0]
-    mrd_types = specific_products['mrd_type'].values
-    vrd_types = specific_products['vrd_type'].values
-    return mrd_values, vrd_values, height_value, mrd_types, vrd_types
-
-# Functions to fetch alternative products by specifications
-def fetch_alternative_products_by_specs(df_Schoeck, df_Leviat, mrd_value, vrd_value, height_value, mrd_min, mrd_max, vrd_min, vrd_max):
-    df_Schoeck['Height'] = pd.to_numeric(df_Schoeck['product_name'].str.extract(r'H(\d+)')[0], errors='coerce')
-    df_Schoeck_filtered = df_Schoeck[
-        (df_Schoeck['mRd'] >= mrd_min) & (df_Schoeck['mRd'] <= mrd_max) &
-        (df_Schoeck['vRd'] >= vrd_min) & (df_Schoeck['vRd'] <= vrd_max) &
-        (df_Schoeck['Height'] == height_value)
-    ][['product_name', 'mRd', 'vRd', 'Height']]
-
-    preprocessed_df_leviat = preprocess_additional_file(df_Leviat)
-    df_Leviat_filtered = preprocessed_df_leviat[
-        (preprocessed_df_leviat['mRd_minus'] >= mrd_min) & (preprocessed_df_leviat['mRd_minus'] <= mrd_max) &
-        (preprocessed_df_leviat['vRd_plus'] >= vrd_min) & (preprocessed_df_leviat['vRd_plus'] <= vrd_max) &
-        (preprocessed_df_leviat['hh'] == height_value)
-    ][['product_name', 'mRd_minus', 'vRd_plus', 'hh', 'mrd_type', 'vrd_type']]
-
-    return df_Schoeck_filtered, df_Leviat_filtered
-
-def format_dataframe(df):
-    if not df.empty:
-        df.loc[:, df.select_dtypes(include=['float']).columns] = df.select_dtypes(include=['float']).apply(lambda x: x.astype(float).map('{:.2f}'.format))
-    return df
-
-# User input and search ranges
-input_type = st.selectbox("Choose input type:", ["Model Number", "Specifications"])
-
-st.write("### Set Search Ranges:")
-col_mrd, col_vrd = st.columns(2)
-
-with col_mrd:
-    mrd_lower_bound = st.number_input("MRD Lower Bound", min_value=0.0, value=0.99, step=0.01, format="%.2f")
-    mrd_upper_bound = st.number_input("MRD Upper Bound", min_value=0.0, value=1.03, step=0.01, format="%.2f")
-
-with col_vrd:
-    vrd_lower_bound = st.number_input("VRD Lower Bound", min_value=0.0, value=0.99, step=0.01, format="%.2f")
-    vrd_upper_bound = st.number_input("VRD Upper Bound", min_value=0.0, value=1.03, step=0.01, format="%.2f")
-
-# Conditional display of input boxes and fetch results
-if input_type == "Model Number":
-    product_name = st.text_input("Input Model Number:")
+for column, vendor in zip(st.columns(len(VENDORS)), VENDORS.values()):
+    with column:
+        title, example = vendor.example
+        st.write(f"### {title} Example:")
+        st.write(example)
+
+# The shared, preprocessed catalog is built once per process and reused across
+# reruns. All searches go through the engine (engine.py) that also backs the
+# CLI and the HTTP endpoint; CATALOG_BACKEND=sqlite switches it to indexed SQL.
+engine = SearchEngine()
+
+# Cache internals (database paths, refresh errors) are only shown with the
+# rest of the instrumentation, not to every user
+if metrics_enabled():
+    with st.sidebar.expander("Catalog cache"):
+        st.json(cache_stats())
+
+    with st.sidebar.expander("Query cache"):
+        st.json(query_cache.stats())
+
+# Long results are shown a page at a time
+RESULT_PAGE_SIZE = 250
+
+def show_results(df, key, product_name=None):
+    with span("render") as current:
+        df, column_config = format_dataframe(df, product_name)
+        pages = -(-len(df) // RESULT_PAGE_SIZE)
+        page = 1
+        if pages > 1:
+            page = st.number_input(f"Page (of {pages}):", min_value=1, max_value=pages, value=1, key=key)
+            st.caption(f"Rows {(page - 1) * RESULT_PAGE_SIZE + 1}–{min(page * RESULT_PAGE_SIZE, len(df))} of {len(df)}")
+        shown = df.iloc[(page - 1) * RESULT_PAGE_SIZE:page * RESULT_PAGE_SIZE]
+        st.dataframe(shown, column_config=column_config)
+        current.add_frame(shown)
+
+# Full result sets are exported from the raw frame, written in chunks and
+# only encoded when the download is clicked
+def show_export(df, key, file_stem="alternatives"):
+    fmt = st.selectbox("Export format:", available_formats(), key=key + "-format")
+    st.download_button(
+        f"Download all {len(df)} rows as {fmt}", lambda: export_bytes(df, fmt),
+        file_name=export_name(file_stem, fmt), mime=export_mime(fmt), key=key + "-download", on_click="ignore")
+
+# Shown when a vendor has nothing inside the search window: the closest
+# products within the height tolerance that still carry the required load
+def show_closest(closest, key, product_name=None):
+    if not closest.empty:
+        st.write(f"Closest alternatives with at least the required capacity (height ±{NEAREST_HEIGHT_TOLERANCE} mm):")
+        show_results(closest, key, product_name)
+
+# Products of all vendors that carry at least the required load, ranked by
+# utilization, with the Pareto-optimal ones marked
+def show_ranking(key, catalog, concrete_class, height_value, mrd_value, vrd_value, product_name=None):
+    if st.checkbox("Rank substitutes from all vendors by utilization", key=key):
+        ranked = engine.rank(concrete_class, height_value, mrd_value, vrd_value, catalog)
+        if ranked.empty:
+            st.write("No product of this height carries the required load.")
+        else:
+            show_results(ranked, key + "-results", product_name)
+
+# A clicked suggestion replaces the typed model number before the rerun
+def use_suggestion(name):
+    st.session_state["model-number"] = name
+
+# A model number listed only for other concrete classes names those classes;
+# otherwise model numbers of any vendor completing or close to the input
+def show_suggestions(catalog, concrete_class, product_name):
+    classes = engine.classes_with_name(product_name, catalog)
+    if classes:
+        st.write(f"{product_name} is not listed for concrete class {concrete_class}. "
+                 f"Choose one of the concrete classes it is available in: {', '.join(classes)}.")
+        return
+    suggestions = engine.suggest(product_name, catalog=catalog)
+    if suggestions.empty:
+        st.write("Model number not found in any vendor's catalog.")
+        return
+    st.write("Model number not found. Did you mean:")
+    for i, (name, vendor) in enumerate(zip(suggestions['product_name'], suggestions['vendor'])):
+        st.button(f"{name} ({VENDORS[vendor].label})", key=f"suggestion-{i}", on_click=use_suggestion, args=(name,))
+
+# Spans and cProfile trace of one run of the search section
+def show_performance(started, profiler):
+    if performance_panel is None:
+        return
+    with performance_panel.container(), st.expander("Performance"):
+        if metrics_enabled():
+            st.write("This run of the search section:")
+            st.dataframe(recent(started, threading.get_ident()), column_config={"ms": st.column_config.NumberColumn(format="%.2f")})
+            st.write("Since the process started:")
+            st.dataframe(summary(), column_config={column: st.column_config.NumberColumn(format="%.2f") for column in ("total_ms", "mean_ms", "max_ms")})
+        if profiler is not None:
+            profile_path, profile_report = stop_profile(profiler, "search")
+            st.caption(f"cProfile trace saved to {profile_path}")
+            st.code(profile_report)
+
+# User input, search ranges and results of the selected input type
+def show_search_inputs():
+    input_type = st.selectbox("Choose input type:", ["Model Number", "Specifications", "Batch (BOM)"])
+    catalog = engine.catalog()
+    concrete_class = st.selectbox(
+        "Concrete class:", catalog.concrete_classes,
+        index=catalog.concrete_classes.index(DEFAULT_CONCRETE_CLASS) if DEFAULT_CONCRETE_CLASS in catalog.concrete_classes else 0)
+
+    st.write("### Set Search Ranges:")
+    col_mrd, col_vrd = st.columns(2)
+
+    with col_mrd:
+        mrd_lower_bound = st.number_input("MRD Lower Bound", min_value=0.0, value=0.99, step=0.01, format="%.2f")
+        mrd_upper_bound = st.number_input("MRD Upper Bound", min_value=0.0, value=1.03, step=0.01, format="%.2f")
+
+    with col_vrd:
+        vrd_lower_bound = st.number_input("VRD Lower Bound", min_value=0.0, value=0.99, step=0.01, format="%.2f")
+        vrd_upper_bound = st.number_input("VRD Upper Bound", min_value=0.0, value=1.03, step=0.01, format="%.2f")
+
+    # Conditional display of input boxes and fetch results
+    if input_type == "Model Number":
+        product_name = st.text_input("Input Model Number:", key="model-number")
+        search_bounds = (mrd_lower_bound, mrd_upper_bound, vrd_lower_bound, vrd_upper_bound)
     
-    if product_name:
-        mrd_value_schoeck, vrd_value_schoeck, height_value_schoeck = fetch_specs_by_model_schoeck(df_Schoeck, product_name)
-        mrd_values_leviat, vrd_values_leviat, height_value_leviat, mrd_types_leviat, vrd_types_leviat = fetch_specs_by_model_leviat(df_Leviat, product_name)
-        
-        st.write("## Your Alternative Products:")
-        
-        if mrd_value_schoeck is not None and vrd_value_schoeck is not None and height_value_schoeck is not None:
-            specific_product_schoeck = df_Schoeck[df_Schoeck['product_name'] == product_name]
-            alternative_products_schoeck, alternative_products_leviat = fetch_alternative_products_by_specs(
-                df_Schoeck, df_Leviat, mrd_value_schoeck, vrd_value_schoeck, height_value_schoeck,
-                mrd_value_schoeck * mrd_lower_bound, mrd_value_schoeck * mrd_upper_bound,
-                vrd_value_schoeck * vrd_lower_bound, vrd_value_schoeck * vrd_upper_bound)
-            
-            if not alternative_products_schoeck.empty:
-                alternative_products_schoeck = format_dataframe(alternative_products_schoeck)
-                specific_product_schoeck = format_dataframe(specific_product_schoeck[['product_name', 'mRd', 'vRd', 'Height']])
-
-                def highlight_product_schoeck(row):
-                    if row['product_name'] == product_name:
-                        return ['background-color: yellow'] * len(row)
-                    else:
-                        return [''] * len(row)
-                
-                st.write("From Schöck's Database:")
-                st.write(alternative_products_schoeck.style.apply(highlight_product_schoeck, axis=1))
-            else:
-                st.write("No alternative products found in Schöck's files.")
-            
-            if not alternative_products_leviat.empty:
-                alternative_products_leviat = format_dataframe(alternative_products_leviat)
-
-                def highlight_product_leviat(row):
-                    if row['product_name'] == product_name:
-                        return ['background-color: yellow'] * len(row)
-                    else:
-                        return [''] * len(row)
-                
-                st.write("From Leviat's Database:")
-                st.write(alternative_products_leviat.style.apply(highlight_product_leviat, axis=1))
+        if product_name:
+            matches = engine.search_model(concrete_class, product_name, search_bounds, catalog=catalog)
+
+            if not matches:
+                show_suggestions(catalog, concrete_class, product_name)
             else:
-                st.write("No alternative products found in Leviat's files.")
+                st.write("## Your Alternative Products:")
         
-        if mrd_values_leviat is not None and vrd_values_leviat is not None and height_value_leviat is not None:
-            for mrd_value, vrd_value, mrd_type, vrd_type in zip(mrd_values_leviat, vrd_values_leviat, mrd_types_leviat, vrd_types_leviat):
-                alternative_products_schoeck, alternative_products_leviat = fetch_alternative_products_by_specs(
-                    df_Schoeck, df_Leviat, mrd_value, vrd_value, height_value_leviat,
-                    mrd_value * mrd_lower_bound, mrd_value * mrd_upper_bound,
-                    vrd_value * vrd_lower_bound, vrd_value * vrd_upper_bound)
-                
-                if not alternative_products_schoeck.empty:
-                    alternative_products_schoeck = format_dataframe(alternative_products_schoeck[['product_name', 'mRd', 'vRd', 'Height']])
-
-                    def highlight_product_schoeck(row):
-                        if row['product_name'] == product_name:
-                            return ['background-color: yellow'] * len(row)
+                for match in matches:
+                    for target_key, target in VENDORS.items():
+                        results = match.alternatives[target_key]
+                        if not results.empty:
+                            st.write(f"From {target.label}'s Database:")
+                            show_results(results, f"{match.vendor}-{target_key}", match.product_name)
+                            show_export(results, f"{match.vendor}-{target_key}-export", f"alternatives-{target_key}")
                         else:
-                            return [''] * len(row)
-                    
-                    st.write("From Schöck's Database:")
-                    st.write(alternative_products_schoeck.style.apply(highlight_product_schoeck, axis=1))
-                else:
-                    st.write("No alternative products found in Schöck's files.")
-                
-                if not alternative_products_leviat.empty:
-                    alternative_products_leviat = format_dataframe(alternative_products_leviat[['product_name', 'mRd_minus', 'vRd_plus', 'hh', 'mrd_type', 'vrd_type']])
-
-                    def highlight_product_leviat(row):
-                        if row['product_name'] == product_name:
-                            return ['background-color: yellow'] * len(row)
-                        else:
-                            return [''] * len(row)
-                    
-                    st.write("From Leviat's Database:")
-                    st.write(alternative_products_leviat.style.apply(highlight_product_leviat, axis=1))
-                else:
-                    st.write("No alternative products found in Leviat's files.")
-else:
-    mRd_value = st.number_input("Input mRd value:", format="%.2f")
-    vRd_value = st.number_input("Input vRd value:", format="%.2f")
-    height_value = st.number_input("Input Height value (in intervals of 10):", step=10, format="%d")
+                            st.write(f"No alternative products found in {target.label}'s files.")
+                            show_closest(match.closest[target_key], f"{match.vendor}-{target_key}-closest", match.product_name)
+
+                    show_ranking(f"{match.vendor}-ranking", catalog, concrete_class, match.height, match.mrd, match.vrd, match.product_name)
+    elif input_type == "Specifications":
+        mRd_value = st.number_input("Input mRd value:", format="%.2f")
+        vRd_value = st.number_input("Input vRd value:", format="%.2f")
+        height_value = st.number_input("Input Height value (in intervals of 10):", step=10, format="%d")
     
-    if mRd_value != 0.00 and vRd_value != 0.00:
-        alternative_products_schoeck, additional_products_leviat = fetch_alternative_products_by_specs(
-            df_Schoeck, df_Leviat, mRd_value, vRd_value, height_value,
-            mRd_value * mrd_lower_bound, mRd_value * mrd_upper_bound,
-            vRd_value * vrd_lower_bound, vRd_value * vrd_upper_bound)
+        if mRd_value != 0.00 and vRd_value != 0.00:
+            bounds = (mrd_lower_bound, mrd_upper_bound, vrd_lower_bound, vrd_upper_bound)
+            match = engine.search_specs(concrete_class, height_value, mRd_value, vRd_value, bounds, catalog=catalog)
         
-        st.write("## Your Alternative Products:")
-        
-        if not alternative_products_schoeck.empty:
-            alternative_products_schoeck = format_dataframe(alternative_products_schoeck[['product_name', 'mRd', 'vRd', 'Height']])
-            st.write("From Schöck's Database:")
-            st.write(alternative_products_schoeck)
-        else:
-            st.write("No alternative products found in Schöck's files.")
+            st.write("## Your Alternative Products:")
         
-        if not additional_products_leviat.empty:
-            additional_products_leviat = format_dataframe(additional_products_leviat[['product_name', 'mRd_minus', 'vRd_plus', 'hh', 'mrd_type', 'vrd_type']])
-            st.write("From Leviat's Database:")
-            st.write(additional_products_leviat)
-        else:
-            st.write("No alternative products found in Leviat's files.")
+            for key, vendor in VENDORS.items():
+                if not match.alternatives[key].empty:
+                    st.write(f"From {vendor.label}'s Database:")
+                    show_results(match.alternatives[key], f"specs-{key}")
+                    show_export(match.alternatives[key], f"specs-{key}-export", f"alternatives-{key}")
+                else:
+                    st.write(f"No alternative products found in {vendor.label}'s files.")
+                    show_closest(match.closest[key], f"specs-{key}-closest")
+
+            show_ranking("specs-ranking", catalog, concrete_class, height_value, mRd_value, vRd_value)
+
+            compare_classes = st.multiselect("Compare concrete classes side by side:", catalog.concrete_classes)
+            if compare_classes:
+                compared = engine.compare_classes(compare_classes, height_value, mRd_value, vRd_value, bounds, catalog)
+
+                for column, compare_class in zip(st.columns(len(compare_classes)), compare_classes):
+                    with column:
+                        st.write(f"### {compare_class}")
+                        for key, vendor in VENDORS.items():
+                            st.write(f"From {vendor.label}'s Database:")
+                            show_results(compared[compare_class][key], f"compare-{compare_class}-{key}")
+
+    else:
+        bom_file = st.file_uploader("Upload a bill of materials (CSV or Excel):", type=["csv", "txt", "xlsx", "xls"])
+        bom_text = st.text_area("Or paste model numbers, one per line:")
+
+        model_numbers = []
+        if bom_file is not None:
+            try:
+                model_numbers = read_bom_file(bom_file.name, bom_file.getvalue(), is_known=engine.known_model_numbers)
+            except ImportError:
+                st.write("Reading Excel files requires the openpyxl package; upload a CSV file instead.")
+        model_numbers += parse_model_numbers(bom_text)
+
+        if model_numbers:
+            batch_results = engine.search_batch(
+                concrete_class, model_numbers, (mrd_lower_bound, mrd_upper_bound, vrd_lower_bound, vrd_upper_bound))
+            not_found = batch_results.loc[batch_results['input_vendor'].isna(), 'model_number']
+
+            st.write("## Your Alternative Products:")
+            st.write(f"{len(model_numbers)} model numbers, {batch_results['vendor'].notna().sum()} alternatives found.")
+            if not not_found.empty:
+                st.write("Not found in the catalog: " + ", ".join(not_found))
+            show_export(batch_results, "batch-export")
+            show_results(batch_results, "batch")
+
+# User input, search ranges and results rerun as a fragment: changing an
+# input recomputes only the query and its tables, not the page around it.
+# The current catalog is fetched on every fragment rerun, so a background
+# refresh is picked up without a full rerun.
+@st.fragment
+def search_section():
+    started = time.time()
+    profiler = start_profile() if profile_reruns else None
+    show_search_inputs()
+    show_performance(started, profiler)
+
+
+search_section()
 
 # Explanation of methods
 st.write("## There are two ways to use this app:")
@@ -229,7 +265,4 @@ with col1:
 
 with col2:
     st.write("### Method 2:")
-    st.write("You can input the required moment and shear load resistances along with the total height needed for your project and get the exact model configuration you require. The output product heights are +-20mm of your input, in case the exact specifications you would prefer are not available.")
-
-
-
+    st.write("You can input the required moment and shear load resistances along with the total height needed for your project and get the exact model configuration you require. If no product matches your input exactly, the closest products with at least the required capacity and a height within +-20mm of your input are shown instead.")
@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from catalog import (LEVIAT_TABLES, SCHOECK_TABLES, VENDORS, build_catalog, load_data, preprocess_additional_file, preprocess_schoeck_file,
+                     select_columns)
+from display import format_dataframe
+from engine import DEFAULT_BOUNDS, fetch_alternative_products_by_specs, fetch_specs_by_model, scale_window
+
+# Benchmark suite. Synthetic masterfile.db catalogs with the real table
+# schemas are generated at several sizes (1x is BASE_SCHOECK_ROWS Schöck rows
+# and BASE_LEVIAT_PRODUCTS Leviat products per table), then each stage of the
+# load, preprocess, query and render path is timed separately. Latency is
+# reported as p50/p95 over the runs; peak memory is the Python/numpy heap peak
+# (tracemalloc) of one extra traced run. Results are saved as JSON, and
+# --baseline compares them with an earlier run.
+#
+#   python benchmark.py --scales 1 10 100 --output bench.json
+#   python benchmark.py --baseline bench.json
+BASE_SCHOECK_ROWS = 2000
+BASE_LEVIAT_PRODUCTS = 400
+CONCRETE_CLASSES = ("20/25", "25/30", "30/37")
+HEIGHTS = np.arange(160, 260, 10)
+REGRESSION_THRESHOLD = 1.25
+
+
+# Schöck tables (updated_Isokorb_*_full_columns): capacities as "±7,4" text
+# plus the numeric and type columns derived from the model number
+def schoeck_table(series, rows, rng):
+    heights = rng.choice(HEIGHTS, rows)
+    mrd = np.round(rng.uniform(5, 120, rows), 1)
+    vrd = np.round(rng.uniform(10, 150, rows), 1)
+    m_type = np.char.add("MM", rng.integers(1, 10, rows).astype(str))
+    v_type = np.char.add("VV", rng.choice(["1", "1.2", "2", "2.2", "3"], rows))
+    cv = rng.choice([30, 35, 50], rows)
+    x = 80 if series == "T" else 120
+    classes = rng.choice(CONCRETE_CLASSES, rows, p=[0.2, 0.6, 0.2])
+    model_type = rng.choice(["D", "K"], rows)
+    names = [f"{series}-{t}-{m}-{v}-REI120-CV{c}-X{x}-H{h}-L500-6.{i}"
+             for i, (t, m, v, c, h) in enumerate(zip(model_type, m_type, v_type, cv, heights))]
+    # A few products without a moment capacity, written "-" like the real tables
+    mrd_text = np.where(rng.random(rows) < 0.01, "-", np.char.replace(np.char.add("±", mrd.astype(str)), ".", ","))
+    return pd.DataFrame({
+        'product_name': names, 'mRd': mrd_text, 'vRd': np.char.replace(np.char.add("±", vrd.astype(str)), ".", ","),
+        'mRd_plus': mrd, 'mRd_minus': mrd, 'vRd_plus': vrd, 'vRd_minus': vrd,
+        'C': np.char.add("C", classes), 'Length': "L500", 'Thickness': series, 'Type': model_type,
+        'M-type': m_type, 'V-type': v_type, 'REI-type': "REI120", 'CV-type': np.char.add("CV", cv.astype(str)),
+        'X-type': f"X{x}", 'Height': np.char.add("H", heights.astype(str)), 'Type Number': "6.0",
+    })
+
+
+# Leviat tables (final_file_extended_columns_HIT_*): one row per product,
+# concrete class and load case (mrd_type/vrd_type)
+def leviat_table(thickness, products, rng):
+    product = np.repeat(np.arange(products), len(CONCRETE_CLASSES) * 2)
+    rows = len(product)
+    heights = rng.choice(HEIGHTS, products)[product]
+    csb = (1000 + np.arange(products) % 9000)[product]
+    width = (100 + 10 * (np.arange(products) // 9000))[product]
+    load_case = np.tile([1, 2], products * len(CONCRETE_CLASSES))
+    names = [f"{thickness}-MVX-{c}-{h // 10}-{w}-35" for c, h, w in zip(csb, heights, width)]
+    return pd.DataFrame({
+        'product_name': names, 'mRd_minus': -np.round(rng.uniform(5, 120, rows), 1), 'vRd_plus': np.round(rng.uniform(10, 150, rows), 1),
+        'c': np.tile(np.repeat(CONCRETE_CLASSES, 2), products), 'cc': 35, 'hh': heights, 'h': heights - 35,
+        'mrd_type': load_case, 'vrd_type': load_case, 'Thickness': thickness, 'Type': "MVX", 'CSB': csb, 'Width': width,
+    })
+
+
+def generate_catalog(path, scale, seed=0):
+    rng = np.random.default_rng(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        tables = {}
+        for table in SCHOECK_TABLES:
+            tables[table] = schoeck_table("XT" if "_XT_" in table else "T", BASE_SCHOECK_ROWS * scale, rng)
+        for table in LEVIAT_TABLES:
+            tables[table] = leviat_table(table.split("columns_")[-1], BASE_LEVIAT_PRODUCTS * scale, rng)
+        for table, df in tables.items():
+            df.to_sql(table, conn, index=False)
+        schoeck_names = tables[SCHOECK_TABLES[0]]['product_name'].iloc[:20]
+        leviat_names = tables[LEVIAT_TABLES[0]]['product_name'].iloc[::6].iloc[:20]
+        pd.DataFrame({'schoeck_product': schoeck_names.to_numpy(), 'leviat_product': leviat_names.to_numpy()}).to_sql('product_mapping', conn, index=False)
+        conn.commit()
+    finally:
+        conn.close()
+    return {table: len(df) for table, df in tables.items()}
+
+
+# Times `run(argument)` once per argument, after an untimed warm-up with the
+# first one, then repeats the first call under tracemalloc for the peak heap.
+# `prepare` builds each argument outside the timed region.
+def measure(run, arguments, prepare=lambda argument: argument):
+    arguments = list(arguments)
+    run(prepare(arguments[0]))
+    latencies = []
+    for argument in arguments:
+        argument = prepare(argument)
+        start = time.perf_counter()
+        run(argument)
+        latencies.append(time.perf_counter() - start)
+
+    argument = prepare(arguments[0])
+    tracemalloc.start()
+    try:
+        run(argument)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    latencies = np.array(latencies) * 1000
+    return {
+        'runs': len(latencies),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+        'mean_ms': round(float(latencies.mean()), 3),
+        'peak_mb': round(peak / (1 << 20), 3),
+    }
+
+
+def benchmark_catalog(path, repeat, seed=0):
+    rng = random.Random(seed)
+    slow_repeat = max(3, repeat // 4)
+    stages = {}
+
+    raw = {}
+    for vendor in VENDORS.values():
+        queries = [select_columns(table, vendor.columns) for table in vendor.tables]
+        stages[f'load_data[{vendor.key}]'] = measure(lambda _: [load_data(query, path) for query in queries], range(slow_repeat))
+        raw[vendor.key] = pd.concat([load_data(query, path) for query in queries], ignore_index=True)
+
+    stages['preprocess_schoeck_file'] = measure(preprocess_schoeck_file, range(slow_repeat), lambda _: raw['schoeck'].copy())
+    stages['preprocess_additional_file'] = measure(preprocess_additional_file, range(slow_repeat), lambda _: raw['leviat'])
+    stages['build_catalog'] = measure(lambda _: build_catalog(path, version='benchmark'), range(slow_repeat))
+
+    catalog = build_catalog(path, version='benchmark')
+    indexes = catalog.partitions("25/30")
+    for key, vendor in VENDORS.items():
+        names = indexes[key].frame['product_name'].astype(str).to_numpy()
+        sample = [names[rng.randrange(len(names))] for _ in range(repeat)]
+        stages[f'fetch_specs_by_model[{key}]'] = measure(lambda name: fetch_specs_by_model(vendor, indexes[key], name), sample)
+
+    # Search windows around the specs of random catalog products
+    windows = []
+    for _ in range(repeat):
+        index = indexes[rng.choice(list(indexes))]
+        row = index.frame.iloc[rng.randrange(len(index.frame))]
+        windows.append((float(row[index.height_col]), *scale_window(row[index.mrd_col], row[index.vrd_col], DEFAULT_BOUNDS)))
+    stages['fetch_alternative_products_by_specs'] = measure(
+        lambda window: fetch_alternative_products_by_specs(catalog, "25/30", *window), windows)
+
+    # Rendering a wide result: every product of one height in the class
+    results = [fetch_alternative_products_by_specs(catalog, "25/30", window[0], 0, np.inf, 0, np.inf) for window in windows]
+    named = [(rows, rows['product_name'].iat[0] if len(rows) else None) for result in results for rows in result.values()]
+    stages['format_dataframe'] = measure(lambda item: format_dataframe(*item), named)
+    return stages
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results, baseline=None):
+    regressions = []
+    for scale, entry in results['scales'].items():
+        print(f"\n{scale}x ({sum(entry['rows'].values())} rows)")
+        print(f"{'stage':42} {'p50 ms':>10} {'p95 ms':>10} {'peak MB':>9}  vs baseline p50")
+        for stage, stats in entry['stages'].items():
+            line = f"{stage:42} {stats['p50_ms']:10.3f} {stats['p95_ms']:10.3f} {stats['peak_mb']:9.2f}"
+            previous = (baseline or {}).get('scales', {}).get(scale, {}).get('stages', {}).get(stage)
+            if previous and previous['p50_ms'] > 0:
+                ratio = stats['p50_ms'] / previous['p50_ms']
+                line += f"  {ratio:5.2f}x"
+                if ratio > REGRESSION_THRESHOLD:
+                    line += "  REGRESSION"
+                    regressions.append((scale, stage, ratio))
+            print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark catalog load, preprocessing, query and rendering paths")
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 10, 100], help="catalog sizes as multiples of the base size")
+    parser.add_argument("--repeat", type=int, default=50, help="runs per query stage (load and preprocess stages run a quarter as often)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="keep the generated databases here and reuse them (default: a temporary directory)")
+    parser.add_argument("--output", default="benchmark-results.json", help="where to save the results")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    args = parser.parse_args(argv)
+
+    results = {
+        'revision': git_revision(), 'created': time.strftime("%Y-%m-%dT%H:%M:%S"), 'python': platform.python_version(),
+        'pandas': pd.__version__, 'numpy': np.__version__, 'repeat': args.repeat, 'seed': args.seed, 'scales': {},
+    }
+    with tempfile.TemporaryDirectory() as scratch:
+        data_dir = args.data_dir or scratch
+        os.makedirs(data_dir, exist_ok=True)
+        for scale in args.scales:
+            path = os.path.join(data_dir, f"masterfile-{scale}x.db")
+            if os.path.exists(path) and args.data_dir:
+                rows = {table: int(load_data(f"SELECT COUNT(*) AS n FROM {table}", path)["n"].iat[0]) for table in (*SCHOECK_TABLES, *LEVIAT_TABLES)}
+            else:
+                rows = generate_catalog(path, scale, args.seed)
+            print(f"Benchmarking {scale}x catalog ({sum(rows.values())} rows)...", flush=True)
+            results['scales'][str(scale)] = {'rows': rows, 'stages': benchmark_catalog(path, args.repeat, args.seed)}
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=1)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = print_report(results, baseline)
+    print(f"\nResults saved to {args.output}")
+    if regressions:
+        raise SystemExit(f"{len(regressions)} stages slower than {REGRESSION_THRESHOLD}x the baseline")
+
+
+if __name__ == "__main__":
+    main()
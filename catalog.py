@@ -0,0 +1,866 @@
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field, fields, is_dataclass
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from metrics import span
+from snapshot import read_arrays, read_manifest, read_snapshot, write_snapshot
+
+# Location of the product database, overridable for deployments and tests
+db_path = os.environ.get("MASTERFILE_DB", "masterfile.db")
+# Precompiled columnar snapshot of the database (see `python catalog.py snapshot`)
+snapshot_dir = os.environ.get("CATALOG_SNAPSHOT")
+
+SCHOECK_TABLES = ("updated_Isokorb_T_full_columns", "updated_Isokorb_XT_full_columns")
+LEVIAT_TABLES = ("final_file_extended_columns_HIT_HP", "final_file_extended_columns_HIT_SP")
+
+# Only the columns the app uses are loaded from the vendor tables
+SCHOECK_COLUMNS = ('product_name', 'mRd', 'vRd', 'C')
+LEVIAT_COLUMNS = ('product_name', 'mRd_minus', 'vRd_plus', 'c', 'hh', 'mrd_type', 'vrd_type')
+
+DEFAULT_CONCRETE_CLASS = "25/30"
+
+# Closest-alternative search: number of products returned and the height
+# difference (mm) a product may have from the requested one
+NEAREST_K = 10
+NEAREST_HEIGHT_TOLERANCE = 20
+
+
+def load_data(query, path=None):
+    with span("load_data") as current:
+        conn = sqlite3.connect(path or db_path)
+        df = pd.read_sql_query(query, conn)
+        conn.close()
+        current.add_frame(df)
+    return df
+
+
+def select_columns(table, columns):
+    return "SELECT " + ", ".join(f'"{column}"' for column in columns) + f" FROM {table}"
+
+
+# Dictionary-encode strings that repeat on at least every other row and
+# downcast plain integer columns. Floats stay float64 so that range
+# comparisons give exactly the same answers as before.
+def compact_frame(df):
+    for column in df.columns:
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            continue
+        if pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+            if values.nunique(dropna=False) <= len(values) // 2:
+                df[column] = values.astype('category')
+        elif pd.api.types.is_integer_dtype(values) and not pd.api.types.is_extension_array_dtype(values):
+            df[column] = pd.to_numeric(values, downcast='integer')
+    return df
+
+# Preprocessing functions. Leviat rows are normalized for every concrete
+# class at once; `c` is kept as a categorical dimension.
+def preprocess_additional_file(df_Leviat):
+    normalized_df = df_Leviat.copy()
+    normalized_df['mRd_minus'] = normalized_df['mRd_minus'].astype(str).str.replace(',', '.').str.replace('-', '').astype(float)
+    normalized_df['vRd_plus'] = normalized_df['vRd_plus'].astype(str).str.replace(',', '.').str.replace('-', '').astype(float)
+    normalized_df['c'] = normalized_df['c'].astype('category')
+    return normalized_df
+
+# Schöck model numbers, e.g. T-K-M9-VV1-REI120-CV35-X80-H200-6.2 or
+# T-D-MM1-VV1-REI120-CV35-X80-H160-L500-6.0. Segments after the type are
+# optional so that XT and Q names with fewer segments still parse.
+SCHOECK_MODEL_PATTERN = (
+    r'^(?P<series>[^-]+)-(?P<model_type>[^-]+)'
+    r'(?:-(?P<m_class>M[^-]*))?(?:-(?P<v_class>V[^-]*))?'
+    r'(?:-REI(?P<rei>\d+))?(?:-CV(?P<cv>\d+))?(?:-X(?P<x>\d+))?'
+    r'(?:-H(?P<Height>\d+))?(?:-L(?P<length>\d+))?(?:-(?P<variant>\d+(?:\.\d+)?))?$'
+)
+SCHOECK_MODEL_INTEGERS = ['rei', 'cv', 'x', 'Height', 'length']
+
+
+def parse_schoeck_model_numbers(product_names):
+    parsed = product_names.str.strip().str.extract(SCHOECK_MODEL_PATTERN)
+    # Names outside the grammar still get their height from the H segment
+    parsed['Height'] = parsed['Height'].fillna(product_names.str.extract(r'-H(\d+)(?:-|$)')[0])
+    for column in SCHOECK_MODEL_INTEGERS:
+        parsed[column] = pd.to_numeric(parsed[column], errors='coerce').astype('Int16')
+    for column in ['series', 'model_type', 'm_class', 'v_class', 'variant']:
+        parsed[column] = parsed[column].astype('category')
+    return parsed
+
+
+def preprocess_schoeck_file(df_Schoeck):
+    df_Schoeck['mRd'] = df_Schoeck['mRd'].astype(str).str.replace(',', '.').str.replace('±', '').str.replace('-', '0').astype(float)
+    df_Schoeck['vRd'] = df_Schoeck['vRd'].astype(str).str.replace(',', '.').str.replace('±', '').str.replace('-', '0').astype(float)
+    parsed = parse_schoeck_model_numbers(df_Schoeck['product_name'])
+    df_Schoeck[parsed.columns] = parsed
+    # Schöck writes the concrete class as "C25/30"; store it like Leviat's c
+    if 'C' in df_Schoeck.columns:
+        df_Schoeck['c'] = df_Schoeck['C'].fillna('C' + DEFAULT_CONCRETE_CLASS).astype(str).str.removeprefix('C').astype('category')
+    else:
+        df_Schoeck['c'] = pd.Categorical([DEFAULT_CONCRETE_CLASS] * len(df_Schoeck))
+    return df_Schoeck
+
+
+def prepare_schoeck_file(df_Schoeck):
+    return preprocess_schoeck_file(df_Schoeck).drop(columns='C')
+
+
+# Vendor registry. Each vendor declares its source tables, the columns loaded
+# from them, the preprocessing that turns raw rows into numeric specs with a
+# `c` column, and which of its columns map onto the unified schema (height,
+# mrd, vrd and the load-case types mrd_type/vrd_type). Catalog build, indexes,
+# snapshots, the SQL table, search and the app all iterate over VENDORS, so a
+# further manufacturer only needs one more register_vendor call.
+UNIFIED_LOAD_CASE_COLUMNS = ('mrd_type', 'vrd_type')
+
+
+@dataclass(frozen=True)
+class Vendor:
+    key: str
+    label: str
+    tables: tuple
+    columns: tuple
+    preprocess: Callable
+    height_col: str
+    mrd_col: str
+    vrd_col: str
+    # Vendor columns stored as UNIFIED_LOAD_CASE_COLUMNS, in that order. A
+    # vendor with load cases has one row per case of a product.
+    load_case_cols: tuple = ()
+    # dtypes restored when rows are read back from the SQL engine
+    dtypes: dict = field(default_factory=dict)
+    # (title, model number) shown as an input example
+    example: tuple = ()
+
+    @property
+    def index_columns(self):
+        return (self.height_col, self.mrd_col, self.vrd_col)
+
+    @property
+    def result_columns(self):
+        return ['product_name', self.mrd_col, self.vrd_col, self.height_col, *self.load_case_cols]
+
+    def load_case_labels(self, rows):
+        labels = np.full(len(rows), '', dtype=object)
+        for position, column in enumerate(self.load_case_cols):
+            labels = labels + ('/' if position else '') + rows[column].astype(str).to_numpy(dtype=object)
+        return labels
+
+
+VENDORS = {}
+
+
+def register_vendor(vendor):
+    VENDORS[vendor.key] = vendor
+    return vendor
+
+
+register_vendor(Vendor(
+    'schoeck', 'Schöck', SCHOECK_TABLES, SCHOECK_COLUMNS, prepare_schoeck_file, 'Height', 'mRd', 'vRd',
+    dtypes={'Height': 'Int16'}, example=('Schöck', 'T-K-M9-VV1-REI120-CV35-X80-H200-6.2')))
+register_vendor(Vendor(
+    'leviat', 'Leviat', LEVIAT_TABLES, LEVIAT_COLUMNS, preprocess_additional_file, 'hh', 'mRd_minus', 'vRd_plus',
+    load_case_cols=('mrd_type', 'vrd_type'), dtypes={'hh': 'int16', 'mrd_type': 'int8', 'vrd_type': 'int8'},
+    example=('Halfen/Leviat', 'HIT_SP-MVX-1407-16-100-35')))
+
+
+# Model numbers are matched case-insensitively, ignoring whitespace and
+# treating "_" and "-" alike, so pasted names resolve without extra scans.
+def normalize_model_number(product_name):
+    return re.sub(r'\s+', '', str(product_name)).upper().replace('_', '-')
+
+
+def normalize_model_numbers(product_names):
+    return product_names.astype(str).str.replace(r'\s+', '', regex=True).str.upper().str.replace('_', '-')
+
+
+def relative_distance(values, target):
+    return (values - target) / max(abs(float(target)), 1e-9)
+
+
+# Sorted range index over one vendor partition. Rows are ordered by
+# (height, mRd, vRd), so each height is a contiguous block that is itself
+# sorted by mRd: a query looks the block up in `heights`, cuts the mRd range
+# with two binary searches and only then filters vRd on the remaining slice.
+# Model numbers are looked up in `name_keys`, the sorted normalized names as
+# UTF-8 bytes (a fixed-width array, one byte per ASCII character); the rows of
+# name_keys[i] are name_rows[name_offsets[i]:name_offsets[i + 1]].
+@dataclass(frozen=True)
+class HeightIndex:
+    frame: pd.DataFrame
+    height_col: str
+    mrd_col: str
+    vrd_col: str
+    heights: dict
+    mrd: np.ndarray
+    vrd: np.ndarray
+    name_keys: np.ndarray
+    name_offsets: np.ndarray
+    name_rows: np.ndarray
+
+    def positions(self, height, mrd_min, mrd_max, vrd_min, vrd_max):
+        start, stop = self.heights.get(height, (0, 0))
+        mrd = self.mrd[start:stop]
+        lo = start + int(np.searchsorted(mrd, mrd_min, side='left'))
+        hi = start + int(np.searchsorted(mrd, mrd_max, side='right'))
+        vrd = self.vrd[lo:hi]
+        return lo + np.flatnonzero((vrd >= vrd_min) & (vrd <= vrd_max))
+
+    def query(self, height, mrd_min, mrd_max, vrd_min, vrd_max):
+        return self.frame.iloc[self.positions(height, mrd_min, mrd_max, vrd_min, vrd_max)]
+
+    # Closest products that still carry the required load: heights within the
+    # tolerance, mRd and vRd at least the required values, ranked by relative
+    # distance over (mRd, vRd, height). In each height block the mRd cut is a
+    # binary search, so only rows above the required mRd are scored.
+    def nearest(self, height, mrd, vrd, k=NEAREST_K, height_tolerance=NEAREST_HEIGHT_TOLERANCE):
+        positions, heights = [np.empty(0, dtype=np.int64)], [np.empty(0)]
+        if not pd.isna(height):
+            for value, (start, stop) in self.heights.items():
+                if abs(value - height) <= height_tolerance:
+                    lo = start + int(np.searchsorted(self.mrd[start:stop], mrd, side='left'))
+                    candidates = lo + np.flatnonzero(self.vrd[lo:stop] >= vrd)
+                    positions.append(candidates)
+                    heights.append(np.full(len(candidates), value))
+        positions, heights = np.concatenate(positions), np.concatenate(heights)
+        distance = np.sqrt(relative_distance(self.mrd[positions], mrd) ** 2 + relative_distance(self.vrd[positions], vrd) ** 2 +
+                           relative_distance(heights, height) ** 2)
+        order = np.lexsort((positions, distance))[:k]
+        return self.frame.iloc[positions[order]].assign(distance=distance[order])
+
+    # (start, stop) into name_rows for each normalized key; unknown keys get
+    # an empty range
+    def name_ranges(self, keys):
+        keys = encode_keys(keys)
+        if not len(self.name_keys):
+            return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=np.int64)
+        slots = np.minimum(np.searchsorted(self.name_keys, keys), len(self.name_keys) - 1)
+        found = self.name_keys[slots] == keys
+        return np.where(found, self.name_offsets[slots], 0), np.where(found, self.name_offsets[slots + 1], 0)
+
+    def positions_of(self, product_name):
+        (start,), (stop,) = self.name_ranges([normalize_model_number(product_name)])
+        return self.name_rows[start:stop]
+
+    def lookup(self, product_name):
+        return self.frame.iloc[self.positions_of(product_name)]
+
+    def canonical_name(self, product_name):
+        positions = self.positions_of(product_name)
+        return None if not len(positions) else self.frame['product_name'].iat[positions[0]]
+
+
+# UTF-8 sorts like the strings themselves, so searchsorted works on the bytes
+def encode_keys(keys):
+    return np.char.encode(np.array(keys, dtype=str), 'utf-8')
+
+
+def build_name_positions(frame):
+    codes, keys = pd.factorize(normalize_model_numbers(frame['product_name']), sort=True)
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(codes, minlength=len(keys)))
+    return encode_keys(keys), offsets, np.argsort(codes, kind='stable').astype(np.int32)
+
+
+# `names` takes (name_keys, name_offsets, name_rows) computed earlier, e.g.
+# read from a snapshot
+def build_height_index(df, height_col, mrd_col, vrd_col, presorted=False, with_names=True, names=None):
+    frame = df if presorted else df.sort_values([height_col, mrd_col, vrd_col], kind='mergesort').reset_index(drop=True)
+    values, starts = np.unique(frame[height_col].to_numpy(dtype=float, na_value=np.nan), return_index=True)
+    stops = np.append(starts[1:], len(frame))
+    heights = {value: (start, stop) for value, start, stop in zip(values.tolist(), starts.tolist(), stops.tolist())}
+    if names is None:
+        names = build_name_positions(frame) if with_names else (encode_keys([]), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int32))
+    return HeightIndex(
+        frame, height_col, mrd_col, vrd_col, heights,
+        frame[mrd_col].to_numpy(dtype=float), frame[vrd_col].to_numpy(dtype=float), *names)
+
+
+def build_vendor_index(vendor, df, presorted=False, names=None):
+    return build_height_index(df, *VENDORS[vendor].index_columns, presorted=presorted, names=names)
+
+
+# Interval join of many range queries against one HeightIndex. Queries are
+# grouped by height; within each height block the mRd bounds of all queries
+# are cut with one vectorized searchsorted, the ranges are expanded into row
+# positions and the vRd bounds are applied to all of them at once.
+# Returns (query ids, row positions) pairs of every match.
+def range_join(index, heights, mrd_mins, mrd_maxs, vrd_mins, vrd_maxs):
+    heights = np.asarray(heights, dtype=float)
+    starts = np.zeros(len(heights), dtype=np.int64)
+    stops = np.zeros(len(heights), dtype=np.int64)
+    for height in np.unique(heights[~np.isnan(heights)]):
+        block_start, block_stop = index.heights.get(height.item(), (0, 0))
+        queries = np.flatnonzero(heights == height)
+        mrd = index.mrd[block_start:block_stop]
+        starts[queries] = block_start + np.searchsorted(mrd, np.asarray(mrd_mins)[queries], side='left')
+        stops[queries] = block_start + np.searchsorted(mrd, np.asarray(mrd_maxs)[queries], side='right')
+
+    counts = np.maximum(stops - starts, 0)
+    query_ids = np.repeat(np.arange(len(heights)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    positions = np.repeat(starts, counts) + offsets
+
+    vrd = index.vrd[positions]
+    matches = (vrd >= np.asarray(vrd_mins)[query_ids]) & (vrd <= np.asarray(vrd_maxs)[query_ids])
+    return query_ids[matches], positions[matches]
+
+
+# The vendor frames are sorted by (c, height, mRd, vRd) once, so every class
+# partition is a contiguous slice that shares memory with the full frame.
+def sort_for_partitions(df, index_columns):
+    return df.sort_values(['c', *index_columns], kind='mergesort', ignore_index=True)
+
+
+# Concrete class -> (start, stop) of its rows in a frame sorted by class
+def class_ranges(df):
+    codes = df['c'].cat.codes.to_numpy()
+    boundaries = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.append(0, boundaries)
+    stops = np.append(boundaries, len(codes))
+    return {
+        str(df['c'].cat.categories[codes[start]]): (start, stop)
+        for start, stop in zip(starts.tolist(), stops.tolist()) if codes[start] >= 0
+    }
+
+
+def partition_by_class(df):
+    return {concrete_class: df.iloc[start:stop] for concrete_class, (start, stop) in class_ranges(df).items()}
+
+
+# All vendors' rows in the unified schema (vendor, c, height, mrd, vrd and the
+# row's position in its vendor frame), partitioned by class and indexed like a
+# vendor partition, so one range query answers for every vendor at once.
+# Within a vendor, rows keep the order of the vendor's own index.
+@dataclass(frozen=True)
+class UnifiedIndex:
+    index: HeightIndex
+    # Vendor keys, and per indexed row its vendor (a position in `vendors`)
+    # and its position in that vendor's frame, as plain arrays so a search
+    # only gathers the matched positions
+    vendors: tuple
+    vendor_codes: np.ndarray
+    rows: np.ndarray
+
+
+def build_unified_index(part):
+    return UnifiedIndex(
+        build_height_index(part, 'height', 'mrd', 'vrd', presorted=True, with_names=False),
+        tuple(part['vendor'].cat.categories), part['vendor'].cat.codes.to_numpy(), part['row'].to_numpy())
+
+
+def build_unified_frame(frames):
+    parts = [pd.DataFrame({
+        'vendor': key,
+        'c': frame['c'].astype(str).to_numpy(),
+        'height': frame[VENDORS[key].height_col].to_numpy(dtype=float, na_value=np.nan),
+        'mrd': frame[VENDORS[key].mrd_col].to_numpy(dtype=float),
+        'vrd': frame[VENDORS[key].vrd_col].to_numpy(dtype=float),
+        'row': np.arange(len(frame)),
+    }) for key, frame in frames.items()]
+    unified = pd.concat(parts, ignore_index=True).astype({'vendor': 'category', 'c': 'category'})
+    return sort_for_partitions(unified, ('height', 'mrd', 'vrd'))
+
+
+def build_unified_partitions(frames, unified=None):
+    unified = build_unified_frame(frames) if unified is None else unified
+    return {concrete_class: build_unified_index(part) for concrete_class, part in partition_by_class(unified).items()}
+
+
+# Model-number suggestions over the names of every vendor. `keys` holds the
+# normalized names in sorted order, so the completions of a prefix are one
+# contiguous slice found with two binary searches. Near misses fall back to an
+# edit distance over the "-"-separated segments of the name; candidates are
+# the names sharing the most segments with the input, gathered from an
+# inverted index of segments, and only those are scored.
+SUGGESTION_LIMIT = 10
+FUZZY_MAX_DISTANCE = 3
+FUZZY_CANDIDATES = 200
+
+
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+# Levenshtein distance over segments: replacing a segment costs the character
+# edit distance between the two, inserting or dropping one costs its length
+def segment_distance(segments_a, segments_b):
+    previous = [0]
+    for segment in segments_b:
+        previous.append(previous[-1] + len(segment))
+    for segment_a in segments_a:
+        current = [previous[0] + len(segment_a)]
+        for j, segment_b in enumerate(segments_b, 1):
+            current.append(min(previous[j] + len(segment_a), current[j - 1] + len(segment_b),
+                               previous[j - 1] + (0 if segment_a == segment_b else edit_distance(segment_a, segment_b))))
+        previous = current
+    return previous[-1]
+
+
+@dataclass(frozen=True)
+class NameIndex:
+    keys: np.ndarray
+    names: np.ndarray
+    vendors: np.ndarray
+    # segment -> positions of the names containing it
+    segments: dict
+
+    def complete(self, prefix, limit=SUGGESTION_LIMIT):
+        key = normalize_model_number(prefix)
+        lo = int(np.searchsorted(self.keys, key, side='left'))
+        hi = int(np.searchsorted(self.keys, key + '\U0010ffff', side='left'))
+        return np.arange(lo, min(hi, lo + limit))
+
+    def fuzzy(self, text, limit=SUGGESTION_LIMIT, max_distance=FUZZY_MAX_DISTANCE):
+        query = normalize_model_number(text).split('-')
+        postings = [self.segments[segment] for segment in set(query) if segment in self.segments]
+        if not postings:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.keys))
+        candidates = np.flatnonzero(shared)
+        if len(candidates) > FUZZY_CANDIDATES:
+            candidates = candidates[np.argpartition(-shared[candidates], FUZZY_CANDIDATES)[:FUZZY_CANDIDATES]]
+        distances = np.array([segment_distance(query, self.keys[position].split('-')) for position in candidates], dtype=np.int64)
+        keep = distances <= max_distance
+        candidates, distances = candidates[keep], distances[keep]
+        order = np.lexsort((candidates, distances))[:limit]
+        return candidates[order], distances[order]
+
+    # Completions of the input first, then near misses, as a frame of
+    # product_name, vendor and distance (0 for completions)
+    def suggest(self, text, limit=SUGGESTION_LIMIT):
+        positions = self.complete(text, limit)
+        distances = np.zeros(len(positions), dtype=np.int64)
+        if len(positions) < limit:
+            fuzzy, fuzzy_distances = self.fuzzy(text, limit)
+            new = ~np.isin(fuzzy, positions)
+            positions = np.concatenate([positions, fuzzy[new]])[:limit]
+            distances = np.concatenate([distances, fuzzy_distances[new]])[:limit]
+        return pd.DataFrame({'product_name': self.names[positions], 'vendor': self.vendors[positions], 'distance': distances})
+
+
+# Name index over {vendor: frame with product_name}: one entry per distinct
+# name and vendor, whatever the number of rows (classes, load cases) it has
+def build_name_index(frames):
+    names = pd.concat([pd.DataFrame({'product_name': frame['product_name'].astype(str).unique(), 'vendor': key}) for key, frame in frames.items()],
+                      ignore_index=True)
+    names['key'] = normalize_model_numbers(names['product_name'])
+    names = names.sort_values(['key', 'vendor'], kind='mergesort', ignore_index=True)
+    # Postings of every segment: (segment, position) pairs grouped by segment
+    # with one stable sort, then split at the segment boundaries
+    segments = names['key'].str.split('-').explode().reset_index().drop_duplicates(ignore_index=True)
+    codes, uniques = pd.factorize(segments['key'])
+    order = np.argsort(codes, kind='stable')
+    postings = np.split(segments['index'].to_numpy(dtype=np.int64)[order], np.flatnonzero(np.diff(codes[order])) + 1)
+    return NameIndex(
+        names['key'].to_numpy(dtype=object), names['product_name'].to_numpy(dtype=object), names['vendor'].to_numpy(dtype=object),
+        dict(zip(uniques, postings)))
+
+
+# A fully loaded and preprocessed catalog. Instances are shared between all
+# sessions of the process, so the frames must be treated as read-only.
+@dataclass(frozen=True)
+class Catalog:
+    version: str
+    db_path: str
+    mtime: float
+    source: str
+    # Vendor key -> preprocessed frame sorted by (c, height, mRd, vRd)
+    frames: dict
+    # Vendor key -> {concrete class: HeightIndex}
+    vendor_partitions: dict
+    # Concrete class -> UnifiedIndex over all vendors (build_unified_partitions)
+    unified_partitions: dict
+    concrete_classes: tuple
+    build_seconds: float
+    # "rows:sha256" of every vendor table the catalog was built from
+    table_hashes: dict = field(default_factory=dict)
+
+    # Picking a concrete class is a dict lookup; unknown classes get empty indexes
+    def partitions(self, concrete_class=DEFAULT_CONCRETE_CLASS):
+        return {key: self.vendor_partitions[key].get(concrete_class) or build_vendor_index(key, frame.iloc[0:0])
+                for key, frame in self.frames.items()}
+
+    # Several search windows in one pass over the unified index of a class.
+    # Returns {vendor: (query ids, matched rows of the vendor frame)}; when
+    # `vendors` names only some vendors, their own indexes are searched instead.
+    def search_windows(self, concrete_class, heights, mrd_mins, mrd_maxs, vrd_mins, vrd_maxs, vendors=None):
+        if vendors is not None and set(vendors) != set(self.frames):
+            return {key: self.search_vendor_windows(key, concrete_class, heights, mrd_mins, mrd_maxs, vrd_mins, vrd_maxs) for key in vendors}
+        unified = self.unified_partitions.get(concrete_class)
+        if unified is None:
+            return {key: (np.empty(0, dtype=np.int64), frame.iloc[0:0]) for key, frame in self.frames.items()}
+        query_ids, positions = range_join(unified.index, heights, mrd_mins, mrd_maxs, vrd_mins, vrd_maxs)
+        codes, rows = unified.vendor_codes[positions], unified.rows[positions]
+        results = {}
+        for key, frame in self.frames.items():
+            matched = codes == unified.vendors.index(key) if key in unified.vendors else np.zeros(len(codes), dtype=bool)
+            results[key] = (query_ids[matched], frame.iloc[rows[matched]])
+        return results
+
+    def search_vendor_windows(self, vendor, concrete_class, heights, mrd_mins, mrd_maxs, vrd_mins, vrd_maxs):
+        index = self.vendor_partitions[vendor].get(concrete_class)
+        if index is None:
+            return np.empty(0, dtype=np.int64), self.frames[vendor].iloc[0:0]
+        query_ids, positions = range_join(index, heights, mrd_mins, mrd_maxs, vrd_mins, vrd_maxs)
+        return query_ids, index.frame.iloc[positions]
+
+    def search(self, concrete_class, height, mrd_min, mrd_max, vrd_min, vrd_max):
+        matches = self.search_windows(concrete_class, [height], [mrd_min], [mrd_max], [vrd_min], [vrd_max])
+        return {key: rows for key, (_, rows) in matches.items()}
+
+    # Matches for several concrete classes in one masked pass over the full catalog
+    def query_classes(self, concrete_classes, height, mrd_min, mrd_max, vrd_min, vrd_max):
+        results = {}
+        for key, frame in self.frames.items():
+            vendor = VENDORS[key]
+            results[key] = frame[
+                frame['c'].isin(concrete_classes) &
+                (frame[vendor.mrd_col] >= mrd_min) & (frame[vendor.mrd_col] <= mrd_max) &
+                (frame[vendor.vrd_col] >= vrd_min) & (frame[vendor.vrd_col] <= vrd_max) &
+                (frame[vendor.height_col] == height)
+            ]
+        return results
+
+    # Model numbers of every vendor for autocomplete, built on the first
+    # suggestion rather than with every catalog build
+    @cached_property
+    def name_index(self):
+        return build_name_index(self.frames)
+
+    # Up to `limit` model numbers starting with, or else close to, the input
+    def suggest(self, text, limit=SUGGESTION_LIMIT):
+        return self.name_index.suggest(text, limit)
+
+
+def build_partitions(vendor, df):
+    return {concrete_class: build_vendor_index(vendor, part, presorted=True) for concrete_class, part in partition_by_class(df).items()}
+
+
+def assemble_catalog(frames, path, version, source, start, table_hashes=None, vendor_partitions=None, unified=None):
+    vendor_partitions = {key: (vendor_partitions or {}).get(key) or build_partitions(key, frame) for key, frame in frames.items()}
+
+    return Catalog(
+        version=version,
+        db_path=os.path.abspath(path),
+        mtime=os.stat(path).st_mtime,
+        source=source,
+        frames=frames,
+        vendor_partitions=vendor_partitions,
+        unified_partitions=build_unified_partitions(frames, unified),
+        concrete_classes=tuple(sorted(set().union(*vendor_partitions.values()), key=lambda c: (len(c), c))),
+        build_seconds=time.perf_counter() - start,
+        table_hashes=dict(table_hashes or {}),
+    )
+
+
+# Change detection per vendor table: row count plus a hash of the loaded columns
+def table_signature(df):
+    return f"{len(df)}:{hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()}"
+
+
+# Raw frames of one vendor's tables and their signatures, read once for both
+def read_vendor_tables(path, vendor):
+    frames = {table: load_data(select_columns(table, VENDORS[vendor].columns), path) for table in VENDORS[vendor].tables}
+    return frames, {table: table_signature(df) for table, df in frames.items()}
+
+
+def preprocess_vendor(vendor, frames):
+    with span("preprocess", vendor=vendor) as current:
+        df = VENDORS[vendor].preprocess(pd.concat(list(frames.values()), ignore_index=True))
+        current.add_frame(df)
+    with span("compact_sort", vendor=vendor) as current:
+        df = sort_for_partitions(compact_frame(df), VENDORS[vendor].index_columns)
+        current.add_frame(df)
+    return df
+
+
+def build_catalog(path=None, version=None):
+    path = path or db_path
+    start = time.perf_counter()
+    version = version or file_hash(path)
+
+    with span("build_catalog") as current:
+        frames, table_hashes = {}, {}
+        for vendor in VENDORS:
+            raw, hashes = read_vendor_tables(path, vendor)
+            frames[vendor] = preprocess_vendor(vendor, raw)
+            table_hashes.update(hashes)
+        current.add_frame(frames)
+        return assemble_catalog(frames, path, version, 'sqlite', start, table_hashes)
+
+
+# Rebuild only the vendors whose tables changed: the other vendors' frames and
+# partitions are reused as they are. Returns the new catalog (the given one
+# if no vendor table changed) and the list of rebuilt vendors.
+def refresh_catalog(catalog, path=None):
+    path = path or catalog.db_path
+    start = time.perf_counter()
+    frames, partitions, table_hashes, changed = {}, {}, {}, []
+    for vendor in VENDORS:
+        raw, hashes = read_vendor_tables(path, vendor)
+        table_hashes.update(hashes)
+        if vendor in catalog.frames and all(catalog.table_hashes.get(table) == signature for table, signature in hashes.items()):
+            frames[vendor], partitions[vendor] = catalog.frames[vendor], catalog.vendor_partitions[vendor]
+        else:
+            frames[vendor] = preprocess_vendor(vendor, raw)
+            changed.append(vendor)
+    if not changed:
+        return catalog, changed
+    return assemble_catalog(frames, path, file_hash(path), 'sqlite', start, table_hashes, partitions), changed
+
+
+def default_snapshot_dir(path):
+    return snapshot_dir or os.path.abspath(path) + '.snapshot'
+
+
+# Name lookup arrays of every vendor partition, in the order of NAME_ARRAYS
+NAME_ARRAYS = ('name_keys', 'name_offsets', 'name_rows')
+UNIFIED_TABLE = 'unified'
+
+
+# Compile the database into a versioned, preprocessed columnar snapshot. Next
+# to the vendor frames it stores the unified frame, the row range of every
+# class partition and the partitions' name lookup arrays, so loading it does
+# not normalize, group or sort anything again.
+def build_snapshot(path=None, target=None):
+    path = path or db_path
+    stat = os.stat(path)
+    catalog = build_catalog(path)
+    source = {'path': os.path.abspath(path), 'sha256': catalog.version, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+              'tables': catalog.table_hashes}
+    partitions, arrays = {}, {}
+    for vendor, frame in catalog.frames.items():
+        partitions[vendor] = class_ranges(frame)
+        for concrete_class, index in catalog.vendor_partitions[vendor].items():
+            for name in NAME_ARRAYS:
+                arrays[f"{vendor}/{concrete_class}/{name}"] = getattr(index, name)
+    tables = {**catalog.frames, UNIFIED_TABLE: build_unified_frame(catalog.frames)}
+    return write_snapshot(target or default_snapshot_dir(path), tables, source, arrays, partitions)
+
+
+# Memory-map the snapshot if it was built from the current database. A
+# matching mtime/size is trusted; otherwise the content hash must match.
+# Returns None when the snapshot is missing or stale.
+def load_snapshot_catalog(path, signature, version=None):
+    target = default_snapshot_dir(path)
+    manifest = read_manifest(target)
+    if manifest is None:
+        return None
+    source = manifest['source']
+    if (source['mtime_ns'], source['size']) != signature and source['sha256'] != (version or file_hash(path)):
+        return None
+
+    start = time.perf_counter()
+    tables, arrays = read_snapshot(target, manifest), read_arrays(target, manifest)
+    if set(tables) != {*VENDORS, UNIFIED_TABLE} or set(manifest['partitions']) != set(VENDORS):
+        return None
+    frames = {vendor: tables[vendor] for vendor in VENDORS}
+    vendor_partitions = {
+        vendor: {concrete_class: build_vendor_index(
+                     vendor, frames[vendor].iloc[start_row:stop_row], presorted=True,
+                     names=tuple(arrays[f"{vendor}/{concrete_class}/{name}"] for name in NAME_ARRAYS))
+                 for concrete_class, (start_row, stop_row) in manifest['partitions'][vendor].items()}
+        for vendor in VENDORS}
+    return assemble_catalog(frames, path, source['sha256'], 'snapshot', start, source.get('tables'), vendor_partitions, tables[UNIFIED_TABLE])
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Bytes held by the index structures of a catalog: arrays that own their data
+# or map a snapshot file (the mRd/vRd arrays are often views of the frames),
+# the strings of object arrays, and dicts. Frames are counted separately.
+def index_bytes(value):
+    if isinstance(value, pd.DataFrame):
+        return 0
+    if isinstance(value, np.ndarray):
+        owned = value.nbytes if value.flags.owndata or isinstance(value, np.memmap) else 0
+        return owned + (sum(sys.getsizeof(item) for item in value) if value.dtype == object else 0)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(index_bytes(key) + index_bytes(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(index_bytes(item) for item in value)
+    if is_dataclass(value):
+        return sum(index_bytes(getattr(value, entry.name)) for entry in fields(value))
+    return sys.getsizeof(value)
+
+
+# Bytes per vendor table as loaded by the original `SELECT *` path and as
+# held by the catalog, for sizing server containers: the compact frames, the
+# vendor's class indexes, and rows for the structures shared by all vendors
+# (the unified index with its frame, and the name index for suggestions,
+# which is built here if no suggestion has been made yet). `ratio` compares
+# everything the catalog holds for a vendor with the raw tables.
+def memory_report(path=None):
+    path = path or db_path
+    catalog = get_catalog(path)
+    rows = []
+    for key, frame in catalog.frames.items():
+        tables = VENDORS[key].tables
+        raw_bytes = sum(int(load_data(f"SELECT * FROM {table}", path).memory_usage(deep=True).sum()) for table in tables)
+        frame_bytes = int(frame.memory_usage(deep=True).sum())
+        vendor_index_bytes = index_bytes(catalog.vendor_partitions[key])
+        rows.append({
+            'vendor': VENDORS[key].label, 'tables': ', '.join(tables), 'rows': len(frame), 'raw_bytes': raw_bytes,
+            'frame_bytes': frame_bytes, 'index_bytes': vendor_index_bytes, 'total_bytes': frame_bytes + vendor_index_bytes,
+            'ratio': round((frame_bytes + vendor_index_bytes) / raw_bytes, 3) if raw_bytes else None,
+        })
+    unified_frame_bytes = sum(int(unified.index.frame.memory_usage(deep=True).sum()) for unified in catalog.unified_partitions.values())
+    shared = [
+        ('unified index', sum(len(unified.rows) for unified in catalog.unified_partitions.values()),
+         unified_frame_bytes, index_bytes(catalog.unified_partitions)),
+        ('name index', len(catalog.name_index.keys), 0, index_bytes(catalog.name_index)),
+    ]
+    for name, count, frame_bytes, structure_bytes in shared:
+        rows.append({'vendor': 'All vendors', 'tables': name, 'rows': count, 'raw_bytes': None, 'frame_bytes': frame_bytes,
+                     'index_bytes': structure_bytes, 'total_bytes': frame_bytes + structure_bytes, 'ratio': None})
+    report = pd.DataFrame(rows)
+    total = {'vendor': 'Total', 'tables': '', 'rows': None, 'raw_bytes': report['raw_bytes'].sum(),
+             **{column: report[column].sum() for column in ('frame_bytes', 'index_bytes', 'total_bytes')}}
+    total['ratio'] = round(total['total_bytes'] / total['raw_bytes'], 3) if total['raw_bytes'] else None
+    return pd.concat([report, pd.DataFrame([total])], ignore_index=True).astype({'rows': 'Int64', 'raw_bytes': 'Int64'})
+
+
+# Process-wide catalog cache. Streamlit re-executes app.py on every rerun but
+# imports this module only once per process, so the cache is shared by all
+# sessions. An entry is reused while the file's mtime/size are unchanged. When
+# they change, a background thread compares the vendor tables' row counts and
+# hashes and rebuilds only the changed vendors; until it is done, sessions keep
+# getting the previous catalog, and the finished one is swapped in with a
+# single assignment, so no session waits or sees a half-built catalog. Each
+# in-flight build or refresh has an Event that is set when it finishes, so a
+# blocking caller, or any caller of a path not loaded yet, waits for it
+# instead of getting the previous catalog or building a second one. Builds
+# and refreshes run outside `_lock`, which only guards the dicts, so other
+# paths and cache_stats() are never held up by them.
+_lock = threading.Lock()
+_catalogs = {}
+_refreshing = {}
+_stats = {"hits": 0, "misses": 0, "builds": 0, "snapshot_loads": 0, "build_seconds": 0.0, "last_build_seconds": None,
+          "refreshes": 0, "vendor_rebuilds": 0, "refresh_errors": 0, "last_refresh_error": None}
+
+
+# First load of a path, from its snapshot or the database
+def _build(path, signature):
+    try:
+        catalog = load_snapshot_catalog(path, signature) or build_catalog(path)
+    except BaseException:
+        with _lock:
+            _refreshing.pop(path).set()
+        raise
+    with _lock:
+        _catalogs[path] = (signature, catalog)
+        _refreshing.pop(path).set()
+        _stats["snapshot_loads" if catalog.source == 'snapshot' else "builds"] += 1
+        _stats["build_seconds"] += catalog.build_seconds
+        _stats["last_build_seconds"] = catalog.build_seconds
+    return catalog
+
+
+def _refresh(path, signature, catalog):
+    try:
+        refreshed, changed = refresh_catalog(catalog, path)
+    except Exception as error:
+        # The database may be mid-update; the next call after a change retries
+        with _lock:
+            _refreshing.pop(path).set()
+            _stats["refresh_errors"] += 1
+            _stats["last_refresh_error"] = repr(error)
+        return
+    with _lock:
+        _catalogs[path] = (signature, refreshed)
+        _refreshing.pop(path).set()
+        _stats["refreshes"] += 1
+        _stats["vendor_rebuilds"] += len(changed)
+        if changed:
+            _stats["build_seconds"] += refreshed.build_seconds
+            _stats["last_build_seconds"] = refreshed.build_seconds
+
+
+# `block=True` refreshes a changed database in the calling thread instead, or
+# waits for the refresh already running and then checks the result again
+def get_catalog(path=None, block=False):
+    path = os.path.abspath(path or db_path)
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    waited = False
+    while True:
+        with _lock:
+            entry = _catalogs.get(path)
+            pending = _refreshing.get(path)
+            if not waited:
+                _stats["misses" if entry is None else "hits"] += 1
+            if entry is None:
+                if pending is None:
+                    _refreshing[path] = threading.Event()
+                    break
+            else:
+                if entry[0] == signature:
+                    return entry[1]
+                if pending is None:
+                    _refreshing[path] = threading.Event()
+                    if not block:
+                        threading.Thread(target=_refresh, args=(path, signature, entry[1]), daemon=True).start()
+                        return entry[1]
+                    break
+                if not block:
+                    return entry[1]
+        # The running build or refresh may have been for an older signature or
+        # failed; the next pass returns its result or starts one of our own
+        pending.wait()
+        waited = True
+
+    if entry is None:
+        return _build(path, signature)
+    _refresh(path, signature, entry[1])
+    with _lock:
+        return _catalogs[path][1]
+
+
+def cache_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["cached_catalogs"] = len(_catalogs)
+        stats["refreshing"] = len(_refreshing)
+        stats["versions"] = {path: f"{entry[1].version[:12]} ({entry[1].source})" for path, entry in _catalogs.items()}
+    return stats
+
+
+def clear_cache():
+    with _lock:
+        _catalogs.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Catalog maintenance for the Product Finder App")
+    parser.add_argument("command", choices=["memory", "snapshot"], help="print the memory report or build the columnar snapshot")
+    parser.add_argument("--db", default=db_path, help="path to masterfile.db")
+    parser.add_argument("--out", help="snapshot directory (default: <db>.snapshot)")
+    args = parser.parse_args()
+
+    if args.command == "memory":
+        print(memory_report(args.db).to_string(index=False))
+    else:
+        manifest = build_snapshot(args.db, args.out)
+        print(f"Snapshot of {manifest['source']['sha256'][:12]} written to {args.out or default_snapshot_dir(args.db)}")
@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import sys
+
+from catalog import DEFAULT_CONCRETE_CLASS, SUGGESTION_LIMIT, db_path
+from engine import CATALOG_BACKEND, DEFAULT_BOUNDS, SearchEngine, to_payload
+from export import EXPORT_FORMATS, export_file
+from search import parse_model_numbers, read_bom_file
+from server import SERVER_HOST, SERVER_PORT, serve
+
+# Command-line access to the search engine. Results are printed as JSON;
+# batch results can be written to CSV, Parquet or Excel instead.
+#
+#   python cli.py model HIT_SP-MVX-1407-16-100-35
+#   python cli.py suggest HIT-SP-MVX-14
+#   python cli.py specs --mrd 50 --vrd 60 --height 200 --rank
+#   python cli.py batch bom.csv --output alternatives.parquet
+#   python cli.py query < queries.jsonl      (one JSON query per line)
+#   python cli.py serve --port 8765
+
+
+def print_json(payload, indent=1):
+    json.dump(payload, sys.stdout, indent=indent)
+    sys.stdout.write("\n")
+
+
+def export_format(path):
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    for fmt, (format_extension, _, _) in EXPORT_FORMATS.items():
+        if extension == format_extension:
+            return fmt
+    raise SystemExit(f"Unknown export format for {path}; use one of " + ", ".join('.' + entry[0] for entry in EXPORT_FORMATS.values()))
+
+
+def read_model_numbers(paths, header=None, is_known=None):
+    model_numbers = []
+    for path in paths:
+        if path == '-':
+            model_numbers += parse_model_numbers(sys.stdin.read())
+        else:
+            with open(path, 'rb') as f:
+                model_numbers += read_bom_file(path, f.read(), header, is_known)
+    return model_numbers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search the Product Finder catalog")
+    parser.add_argument("--db", default=db_path, help="path to masterfile.db")
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default=CATALOG_BACKEND, help="query backend (default: CATALOG_BACKEND or memory)")
+    parser.add_argument("--class", dest="concrete_class", default=DEFAULT_CONCRETE_CLASS, help="concrete class")
+    parser.add_argument("--bounds", nargs=4, type=float, default=DEFAULT_BOUNDS, metavar=("MRD_LOWER", "MRD_UPPER", "VRD_LOWER", "VRD_UPPER"),
+                        help="search window as factors of the required mRd and vRd")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    model = commands.add_parser("model", help="alternatives for a model number")
+    model.add_argument("model_number")
+    model.add_argument("--rank", action="store_true", help="also rank all substitutes by utilization")
+
+    suggest = commands.add_parser("suggest", help="model numbers completing or close to a partial one")
+    suggest.add_argument("text")
+    suggest.add_argument("--limit", type=int, default=SUGGESTION_LIMIT)
+
+    specs = commands.add_parser("specs", help="alternatives for required loads and height")
+    specs.add_argument("--mrd", type=float, required=True)
+    specs.add_argument("--vrd", type=float, required=True)
+    specs.add_argument("--height", type=float, required=True)
+    specs.add_argument("--rank", action="store_true", help="also rank all substitutes by utilization")
+
+    batch = commands.add_parser("batch", help="alternatives for a bill of materials")
+    batch.add_argument("files", nargs="+", help="CSV/Excel BOM files, or - for model numbers on stdin")
+    batch.add_argument("--output", help="write the results to a .csv, .parquet or .xlsx file instead of printing JSON")
+    batch.add_argument("--header", action=argparse.BooleanOptionalAction, default=None,
+                       help="whether the first row of the files is a header (default: detected)")
+
+    commands.add_parser("query", help="answer JSON queries read from stdin, one per line")
+
+    server = commands.add_parser("serve", help="run the HTTP/JSON endpoint")
+    server.add_argument("--host", default=SERVER_HOST)
+    server.add_argument("--port", type=int, default=SERVER_PORT)
+
+    args = parser.parse_args(argv)
+    engine = SearchEngine(args.db, args.backend)
+    bounds = tuple(args.bounds)
+
+    if args.command == "model":
+        print_json(to_payload(engine.search_model(args.concrete_class, args.model_number, bounds, args.rank)))
+    elif args.command == "suggest":
+        print_json(to_payload(engine.suggest(args.text, args.limit)))
+    elif args.command == "specs":
+        print_json(to_payload(engine.search_specs(args.concrete_class, args.height, args.mrd, args.vrd, bounds, args.rank)))
+    elif args.command == "batch":
+        results = engine.search_batch(args.concrete_class, read_model_numbers(args.files, args.header, engine.known_model_numbers), bounds)
+        if args.output:
+            with export_file(results, export_format(args.output)) as exported, open(args.output, 'wb') as out:
+                for block in iter(lambda: exported.read(1 << 20), b''):
+                    out.write(block)
+            print(f"{len(results)} rows written to {args.output}", file=sys.stderr)
+        else:
+            print_json(to_payload(results))
+    elif args.command == "query":
+        defaults = {'concrete_class': args.concrete_class, 'bounds': list(bounds)}
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            try:
+                payload = to_payload(engine.run_query({**defaults, **json.loads(line)}))
+            except (TypeError, ValueError) as error:
+                payload = {"error": str(error)}
+            print_json(payload, indent=None)
+            sys.stdout.flush()
+    else:
+        serve(engine, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
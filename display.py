@@ -0,0 +1,12 @@
+import streamlit as st
+
+# Rendering: values stay numeric and get their two-decimal format from the
+# column config, and the queried product is flagged through one vectorized
+# mask. Kept out of app.py so it can be imported without running the app.
+def format_dataframe(df, product_name=None):
+    column_config = {column: st.column_config.NumberColumn(format="%.2f") for column in df.select_dtypes(include=['float']).columns}
+    if product_name is not None:
+        df = df.assign(queried=(df['product_name'] == product_name).to_numpy())
+        df = df[['queried', *df.columns[:-1]]]
+        column_config['queried'] = st.column_config.CheckboxColumn("Queried", width="small")
+    return df, column_config
@@ -0,0 +1,255 @@
+import json
+import math
+import os
+from dataclasses import dataclass, fields, is_dataclass
+
+import numpy as np
+import pandas as pd
+
+from catalog import DEFAULT_CONCRETE_CLASS, SUGGESTION_LIMIT, VENDORS, db_path, get_catalog
+from equivalence import lookup_equivalents
+from metrics import timed
+from query_cache import query_cache, query_key
+from search import find_alternatives_batch, find_alternatives_for_load_cases, known_model_numbers, rank_alternatives
+from sql_engine import get_sql_catalog
+
+# The search engine shared by the Streamlit app, the CLI and the HTTP server
+# (cli.py, server.py): catalog loading, model-number lookup and the searches,
+# with no UI code. Results are plain frames and dataclasses; `to_payload`
+# turns them into JSON-ready values.
+CATALOG_BACKEND = os.environ.get("CATALOG_BACKEND", "memory")
+DEFAULT_BOUNDS = (0.99, 1.03, 0.99, 1.03)
+
+
+# Function to fetch specifications by model number, resolved through the
+# model-number index of the selected concrete class: every load case of the
+# product for vendors that have them, the first row otherwise
+@timed("fetch_specs_by_model")
+def fetch_specs_by_model(vendor, index, product_name):
+    specific_products = index.lookup(product_name)
+    if specific_products.empty:
+        return None
+    return specific_products if vendor.load_case_cols else specific_products.iloc[:1]
+
+
+# Function to fetch alternative products by specifications, one table per
+# registered vendor from a single search of the unified index
+@timed("fetch_alternative_products_by_specs")
+def fetch_alternative_products_by_specs(catalog, concrete_class, height_value, mrd_min, mrd_max, vrd_min, vrd_max):
+    results = catalog.search(concrete_class, height_value, mrd_min, mrd_max, vrd_min, vrd_max)
+    return {key: rows[VENDORS[key].result_columns] for key, rows in results.items()}
+
+
+# Matches for several concrete classes in one pass over the catalog
+@timed("fetch_alternative_products_by_classes")
+def fetch_alternative_products_by_classes(catalog, concrete_classes, height_value, mrd_min, mrd_max, vrd_min, vrd_max):
+    results = catalog.query_classes(concrete_classes, height_value, mrd_min, mrd_max, vrd_min, vrd_max)
+    return {key: rows[['c', *VENDORS[key].result_columns]] for key, rows in results.items()}
+
+
+# Searches go through the shared query cache, keyed on the catalog version,
+# concrete class, height and the rounded search windows
+def cached_alternative_products_by_specs(catalog, concrete_class, height_value, mrd_min, mrd_max, vrd_min, vrd_max):
+    key = query_key(catalog.version, VENDORS, concrete_class, height_value, [(mrd_min, mrd_max, vrd_min, vrd_max)])
+    return query_cache.get_or_compute(key, lambda: fetch_alternative_products_by_specs(
+        catalog, concrete_class, height_value, *key[4][0]))
+
+
+def cached_alternatives_for_load_cases(catalog, concrete_class, height_value, windows, load_cases, vendors=None):
+    vendors = list(VENDORS if vendors is None else vendors)
+    key = query_key(catalog.version, vendors, concrete_class, height_value, windows) + (tuple(load_cases),)
+    return query_cache.get_or_compute(key, lambda: find_alternatives_for_load_cases(
+        catalog, concrete_class, height_value, key[4], load_cases, vendors))
+
+
+def scale_window(mrd_value, vrd_value, bounds):
+    mrd_lower_bound, mrd_upper_bound, vrd_lower_bound, vrd_upper_bound = bounds
+    return (mrd_value * mrd_lower_bound, mrd_value * mrd_upper_bound, vrd_value * vrd_lower_bound, vrd_value * vrd_upper_bound)
+
+
+# Alternatives for a model number found in one vendor's catalog. `mrd`/`vrd`
+# are the governing (largest) requirements over its load cases; `closest`
+# holds the nearest products for every vendor whose search window was empty.
+@dataclass(frozen=True)
+class ModelMatch:
+    vendor: str
+    product_name: str
+    height: float
+    mrd: float
+    vrd: float
+    load_cases: tuple
+    alternatives: dict
+    closest: dict
+    ranking: pd.DataFrame = None
+
+
+@dataclass(frozen=True)
+class SpecsMatch:
+    height: float
+    mrd: float
+    vrd: float
+    alternatives: dict
+    closest: dict
+    ranking: pd.DataFrame = None
+
+
+class SearchEngine:
+    def __init__(self, path=None, backend=None):
+        self.path = os.path.abspath(path or db_path)
+        self.backend = backend or CATALOG_BACKEND
+
+    # The current catalog, rebuilt (or refreshed in the background) when the
+    # database changes. With backend "sqlite", searches run as indexed SQL
+    # against the materialized catalog_normalized table (see sql_engine.py),
+    # which raises RuntimeError while that table is missing or stale.
+    def catalog(self):
+        return get_sql_catalog(self.path) if self.backend == "sqlite" else get_catalog(self.path)
+
+    @timed("closest")
+    def closest(self, indexes, alternatives, height_value, mrd_value, vrd_value):
+        return {key: indexes[key].nearest(height_value, mrd_value, vrd_value)[[*VENDORS[key].result_columns, 'distance']]
+                for key, rows in alternatives.items() if rows.empty}
+
+    def rank(self, concrete_class, height_value, mrd_value, vrd_value, catalog=None):
+        return rank_alternatives((catalog or self.catalog()).partitions(concrete_class), height_value, mrd_value, vrd_value)
+
+    # Catalog spelling of a pasted model number, or the input when unknown
+    def canonical_name(self, concrete_class, product_name, catalog=None):
+        indexes = (catalog or self.catalog()).partitions(concrete_class)
+        return next(filter(None, (index.canonical_name(product_name) for index in indexes.values())), product_name)
+
+    # Concrete classes in which any vendor lists the model number
+    def classes_with_name(self, product_name, catalog=None):
+        catalog = catalog or self.catalog()
+        return [concrete_class for concrete_class in catalog.concrete_classes
+                if any(index.canonical_name(product_name) for index in catalog.partitions(concrete_class).values())]
+
+    # Model numbers of any vendor completing, or else close to, a partial or
+    # mistyped input: product_name, vendor and edit distance (0 for completions)
+    def suggest(self, text, limit=SUGGESTION_LIMIT, catalog=None):
+        return (catalog or self.catalog()).suggest(text, limit)
+
+    # One ModelMatch per vendor whose catalog contains the model number
+    def search_model(self, concrete_class, product_name, bounds=DEFAULT_BOUNDS, rank=False, catalog=None):
+        catalog = catalog or self.catalog()
+        indexes = catalog.partitions(concrete_class)
+        product_name = self.canonical_name(concrete_class, product_name, catalog)
+        matches = []
+        for source_key, source in VENDORS.items():
+            specs = fetch_specs_by_model(source, indexes[source_key], product_name)
+            if specs is None:
+                continue
+            height_value = specs[source.height_col].astype(float).iat[0]
+            mrd_values = specs[source.mrd_col].to_numpy(dtype=float)
+            vrd_values = specs[source.vrd_col].to_numpy(dtype=float)
+
+            # Precomputed equivalences (equivalence.py), including curated
+            # mappings, answer the other vendors when built for these bounds
+            # from the current vendor tables
+            equivalents = lookup_equivalents(
+                self.path, catalog.table_hashes, source_key, concrete_class, product_name, bounds) or {}
+
+            # All load cases of the product in one search of the vendors the
+            # equivalences do not answer; for vendors with load cases each
+            # alternative lists the cases it satisfies
+            load_cases = source.load_case_labels(specs)
+            windows = [scale_window(mrd_value, vrd_value, bounds) for mrd_value, vrd_value in zip(mrd_values, vrd_values)]
+            searched = [key for key in VENDORS if key not in equivalents]
+            found = cached_alternatives_for_load_cases(catalog, concrete_class, height_value, windows, list(load_cases), searched)
+
+            alternatives = {}
+            for target_key, target in VENDORS.items():
+                columns = [*target.result_columns, *(['load_cases'] if source.load_case_cols else [])]
+                if target_key in equivalents:
+                    alternatives[target_key] = equivalents[target_key][[*columns, 'origin']]
+                else:
+                    alternatives[target_key] = found[target_key][columns]
+
+            mrd_value, vrd_value = mrd_values.max(), vrd_values.max()
+            matches.append(ModelMatch(
+                source_key, product_name, height_value, mrd_value, vrd_value, tuple(load_cases), alternatives,
+                self.closest(indexes, alternatives, height_value, mrd_value, vrd_value),
+                rank_alternatives(indexes, height_value, mrd_value, vrd_value) if rank else None))
+        return matches
+
+    def search_specs(self, concrete_class, height_value, mrd_value, vrd_value, bounds=DEFAULT_BOUNDS, rank=False, catalog=None):
+        catalog = catalog or self.catalog()
+        indexes = catalog.partitions(concrete_class)
+        alternatives = cached_alternative_products_by_specs(catalog, concrete_class, height_value, *scale_window(mrd_value, vrd_value, bounds))
+        return SpecsMatch(
+            height_value, mrd_value, vrd_value, alternatives,
+            self.closest(indexes, alternatives, height_value, mrd_value, vrd_value),
+            rank_alternatives(indexes, height_value, mrd_value, vrd_value) if rank else None)
+
+    # {concrete class: {vendor: rows}} for a side-by-side comparison
+    def compare_classes(self, concrete_classes, height_value, mrd_value, vrd_value, bounds=DEFAULT_BOUNDS, catalog=None):
+        compared = fetch_alternative_products_by_classes(
+            catalog or self.catalog(), concrete_classes, height_value, *scale_window(mrd_value, vrd_value, bounds))
+        return {compare_class: {key: rows[rows['c'] == compare_class].drop(columns='c') for key, rows in compared.items()}
+                for compare_class in concrete_classes}
+
+    # Batch joins need the in-memory indexes, whatever the query backend
+    def search_batch(self, concrete_class, model_numbers, bounds=DEFAULT_BOUNDS):
+        return find_alternatives_batch(get_catalog(self.path).partitions(concrete_class), model_numbers, *bounds)
+
+    # Whether any vendor lists each model number, e.g. to tell a BOM header
+    # from the first model number (search.read_bom_file)
+    def known_model_numbers(self, model_numbers):
+        return known_model_numbers(get_catalog(self.path), model_numbers)
+
+    # A query as sent to the CLI or the HTTP endpoint: a dict with either
+    # "model", "model_numbers" or "mrd"/"vrd"/"height", plus the optional
+    # "concrete_class", "bounds" and "rank". Malformed values raise ValueError.
+    def run_query(self, query):
+        if not isinstance(query, dict):
+            raise ValueError("a query must be a JSON object")
+        concrete_class = query.get('concrete_class')
+        if concrete_class is None:
+            concrete_class = DEFAULT_CONCRETE_CLASS
+        elif concrete_class not in self.catalog().concrete_classes:
+            raise ValueError(f"unknown concrete_class {concrete_class!r}; use one of " + ", ".join(self.catalog().concrete_classes))
+        bounds = query.get('bounds', DEFAULT_BOUNDS)
+        if not isinstance(bounds, (list, tuple)) or len(bounds) != 4:
+            raise ValueError("bounds must be [mrd_lower, mrd_upper, vrd_lower, vrd_upper]")
+        bounds = tuple(query_number(bound, 'bounds') for bound in bounds)
+        rank = query.get('rank', False)
+        if not isinstance(rank, bool):
+            raise ValueError("rank must be true or false")
+
+        if 'model' in query:
+            if not isinstance(query['model'], str) or not query['model'].strip():
+                raise ValueError("model must be a non-empty string")
+            return self.search_model(concrete_class, query['model'], bounds, rank)
+        if 'model_numbers' in query:
+            model_numbers = query['model_numbers']
+            if not isinstance(model_numbers, list) or not all(isinstance(name, str) for name in model_numbers):
+                raise ValueError("model_numbers must be a list of strings")
+            return self.search_batch(concrete_class, model_numbers, bounds)
+        if {'mrd', 'vrd', 'height'} <= query.keys():
+            return self.search_specs(concrete_class, *(query_number(query[key], key) for key in ('height', 'mrd', 'vrd')), bounds, rank)
+        raise ValueError("a query needs 'model', 'model_numbers' or 'mrd', 'vrd' and 'height'")
+
+
+# A finite number from a query; strings and booleans are rejected
+def query_number(value, name):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{name} must be a finite number, not {value!r}")
+    return float(value)
+
+
+# JSON-ready form of engine results: frames become lists of records (missing
+# values as null), dataclasses and dicts become objects
+def to_payload(value):
+    if isinstance(value, pd.DataFrame):
+        return json.loads(value.to_json(orient='records'))
+    if is_dataclass(value):
+        return {field.name: to_payload(getattr(value, field.name)) for field in fields(value)}
+    if isinstance(value, dict):
+        return {str(key): to_payload(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_payload(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is pd.NA or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value
@@ -0,0 +1,223 @@
+import json
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from catalog import (UNIFIED_LOAD_CASE_COLUMNS, VENDORS, build_catalog, build_height_index, db_path, load_data, normalize_model_number,
+                     normalize_model_numbers, range_join)
+from sql_engine import normalized_rows, read_sql
+
+# Precomputed cross-vendor equivalences (Schöck <-> Leviat). For every product
+# row (and every load case) catalog_equivalence holds the rows of the other
+# vendors that a model-number search with EQUIVALENCE_BOUNDS returns, plus the
+# curated pairs of product_mapping, which take priority. A model-number query
+# then reads its cross-vendor alternatives with one indexed lookup.
+#
+# Every row is identified by a key (vendor, class, model number, load case) and
+# a hash of its specs, stored in catalog_equivalence_rows. A rebuild only
+# recomputes the edges of rows that were added, removed or changed, so
+# updating one vendor table leaves the edges of unchanged products alone. The
+# signatures of the vendor tables the edges were built from are kept in
+# catalog_equivalence_meta; lookups are refused once the catalog has moved on.
+EQUIVALENCE_TABLE = "catalog_equivalence"
+EQUIVALENCE_ROWS_TABLE = "catalog_equivalence_rows"
+EQUIVALENCE_META_TABLE = "catalog_equivalence_meta"
+MAPPING_TABLE = "product_mapping"
+
+# Same defaults as the search range inputs of the app
+EQUIVALENCE_BOUNDS = (0.99, 1.03, 0.99, 1.03)
+
+EDGE_COLUMNS = [
+    'source_vendor', 'c', 'source_name_key', 'source_load_case', 'source_key',
+    'target_vendor', 'target_key', 'product_name', 'height', 'mrd', 'vrd', 'mrd_type', 'vrd_type', 'curated',
+]
+
+
+def catalog_rows(catalog):
+    rows = pd.concat([normalized_rows(vendor, frame).assign(load_case=VENDORS[vendor].load_case_labels(frame))
+                      for vendor, frame in catalog.frames.items()], ignore_index=True)
+    key = rows['vendor'] + '|' + rows['c'] + '|' + rows['name_key'] + '|' + rows['load_case']
+    # Repeated rows of one product stay distinct
+    rows['row_key'] = key + '|' + rows.groupby(key, sort=False).cumcount().astype(str)
+    rows['row_hash'] = pd.util.hash_pandas_object(rows[['product_name', 'height', 'mrd', 'vrd']], index=False).astype(str)
+    return rows
+
+
+# Cross-vendor pairs where the target lies inside the source's search window,
+# one range_join per (class, source vendor) against the other vendor's rows
+def match_rows(sources, targets, bounds):
+    mrd_lower, mrd_upper, vrd_lower, vrd_upper = bounds
+    pairs = [pd.DataFrame({'source_key': [], 'target_key': []}, dtype=object)]
+    for (concrete_class, vendor), group in sources.groupby(['c', 'vendor'], sort=False):
+        candidates = targets[(targets['c'] == concrete_class) & (targets['vendor'] != vendor)]
+        if candidates.empty:
+            continue
+        index = build_height_index(candidates, 'height', 'mrd', 'vrd')
+        mrd, vrd = group['mrd'].to_numpy(), group['vrd'].to_numpy()
+        query_ids, positions = range_join(index, group['height'].to_numpy(), mrd * mrd_lower, mrd * mrd_upper, vrd * vrd_lower, vrd * vrd_upper)
+        pairs.append(pd.DataFrame({
+            'source_key': group['row_key'].to_numpy()[query_ids],
+            'target_key': index.frame['row_key'].to_numpy()[positions],
+        }))
+    return pd.concat(pairs, ignore_index=True)
+
+
+# product_mapping has no documented schema: each vendor's column is the one
+# whose values match the most of that vendor's model numbers. Every mapped
+# pair is linked in both directions for each class both products exist in.
+def curated_pairs(path, rows):
+    pairs = [pd.DataFrame({'source_key': [], 'target_key': []}, dtype=object)]
+    try:
+        mapping = load_data(f"SELECT * FROM {MAPPING_TABLE}", path)
+    except (pd.errors.DatabaseError, sqlite3.Error):
+        return pairs[0]
+
+    keys = {column: normalize_model_numbers(mapping[column].astype(str)) for column in mapping.columns}
+    columns = {}
+    for vendor in VENDORS:
+        names = set(rows.loc[rows['vendor'] == vendor, 'name_key'])
+        hits = {column: (values.isin(names) & mapping[column].notna()).sum() for column, values in keys.items() if column not in columns.values()}
+        best = max(hits, key=hits.get, default=None)
+        if best is not None and hits[best] > 0:
+            columns[vendor] = best
+
+    for source, source_column in columns.items():
+        for target, target_column in columns.items():
+            if source == target:
+                continue
+            names = pd.DataFrame({'source': keys[source_column], 'target': keys[target_column]}).drop_duplicates()
+            source_rows = rows.loc[rows['vendor'] == source, ['c', 'name_key', 'row_key']]
+            target_rows = rows.loc[rows['vendor'] == target, ['c', 'name_key', 'row_key']]
+            matched = (names.merge(source_rows, left_on='source', right_on='name_key')
+                       .merge(target_rows, left_on=['target', 'c'], right_on=['name_key', 'c'], suffixes=('_source', '_target')))
+            pairs.append(pd.DataFrame({'source_key': matched['row_key_source'], 'target_key': matched['row_key_target']}))
+    return pd.concat(pairs, ignore_index=True)
+
+
+def edges_from_pairs(pairs, rows, curated):
+    rows = rows.set_index('row_key')
+    source = rows.loc[pairs['source_key']]
+    target = rows.loc[pairs['target_key']]
+    return pd.DataFrame({
+        'source_vendor': source['vendor'].to_numpy(), 'c': source['c'].to_numpy(),
+        'source_name_key': source['name_key'].to_numpy(), 'source_load_case': source['load_case'].to_numpy(),
+        'source_key': pairs['source_key'].to_numpy(),
+        'target_vendor': target['vendor'].to_numpy(), 'target_key': pairs['target_key'].to_numpy(),
+        'product_name': target['product_name'].to_numpy(), 'height': target['height'].to_numpy(),
+        'mrd': target['mrd'].to_numpy(), 'vrd': target['vrd'].to_numpy(),
+        'mrd_type': target['mrd_type'].to_numpy(), 'vrd_type': target['vrd_type'].to_numpy(),
+        'curated': int(curated),
+    }, columns=EDGE_COLUMNS)
+
+
+def create_tables(conn):
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {EQUIVALENCE_TABLE} ({', '.join(EDGE_COLUMNS)})")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {EQUIVALENCE_TABLE}_source ON {EQUIVALENCE_TABLE} (source_vendor, c, source_name_key)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {EQUIVALENCE_TABLE}_source_key ON {EQUIVALENCE_TABLE} (source_key)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {EQUIVALENCE_TABLE}_target_key ON {EQUIVALENCE_TABLE} (target_key)")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {EQUIVALENCE_ROWS_TABLE} (row_key TEXT PRIMARY KEY, row_hash TEXT)")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {EQUIVALENCE_META_TABLE} (key TEXT PRIMARY KEY, value TEXT)")
+
+
+def insert_frame(conn, table, df):
+    values = df.astype(object).where(df.notna(), None)
+    conn.executemany(
+        f"INSERT INTO {table} ({', '.join(df.columns)}) VALUES ({', '.join('?' * len(df.columns))})",
+        values.itertuples(index=False, name=None))
+
+
+# Build or update the equivalence tables. The stored edges are recomputed in
+# full when the bounds differ from the last build (or `full` is set);
+# otherwise only rows whose key or spec hash changed are matched again, in
+# both directions. Curated pairs are small and always replaced.
+def update_equivalences(path=None, bounds=EQUIVALENCE_BOUNDS, full=False):
+    path = path or db_path
+    catalog = build_catalog(path)
+    rows = catalog_rows(catalog)
+    conn = sqlite3.connect(path)
+    try:
+        create_tables(conn)
+        meta = dict(conn.execute(f"SELECT key, value FROM {EQUIVALENCE_META_TABLE}").fetchall())
+        full = full or meta.get('bounds') != json.dumps(list(bounds))
+        stored = pd.read_sql_query(f"SELECT row_key, row_hash FROM {EQUIVALENCE_ROWS_TABLE}", conn)
+
+        if full:
+            changed = set(rows['row_key']) | set(stored['row_key'])
+            computed = match_rows(rows, rows, bounds)
+        else:
+            current = rows[['row_key', 'row_hash']].merge(stored, on='row_key', how='outer', suffixes=('', '_stored'))
+            changed = set(current.loc[current['row_hash'] != current['row_hash_stored'], 'row_key'])
+            updated = rows[rows['row_key'].isin(changed)]
+            computed = pd.concat([match_rows(updated, rows, bounds), match_rows(rows, updated, bounds)], ignore_index=True).drop_duplicates()
+
+        with conn:
+            if full:
+                conn.execute(f"DELETE FROM {EQUIVALENCE_TABLE}")
+            else:
+                conn.execute(f"DELETE FROM {EQUIVALENCE_TABLE} WHERE curated = 1")
+                stale = [(key,) for key in changed]
+                conn.executemany(f"DELETE FROM {EQUIVALENCE_TABLE} WHERE source_key = ?", stale)
+                conn.executemany(f"DELETE FROM {EQUIVALENCE_TABLE} WHERE target_key = ?", stale)
+            insert_frame(conn, EQUIVALENCE_TABLE, edges_from_pairs(computed, rows, curated=False))
+            insert_frame(conn, EQUIVALENCE_TABLE, edges_from_pairs(curated_pairs(path, rows), rows, curated=True))
+            conn.execute(f"DELETE FROM {EQUIVALENCE_ROWS_TABLE}")
+            insert_frame(conn, EQUIVALENCE_ROWS_TABLE, rows[['row_key', 'row_hash']])
+            conn.execute(f"INSERT OR REPLACE INTO {EQUIVALENCE_META_TABLE} VALUES ('bounds', ?)", (json.dumps(list(bounds)),))
+            conn.execute(f"INSERT OR REPLACE INTO {EQUIVALENCE_META_TABLE} VALUES ('table_hashes', ?)",
+                         (json.dumps(catalog.table_hashes, sort_keys=True),))
+    finally:
+        conn.close()
+    return {'rows': len(rows), 'changed': len(changed), 'edges': len(computed), 'full': full}
+
+
+# Cross-vendor alternatives of one product from the precomputed table, as
+# {target vendor: frame} with one row per target product, the source load
+# cases it satisfies and whether it comes from a curated mapping. Returns None
+# when the table is missing, was built for other bounds or from other vendor
+# tables than `table_hashes` (the searched catalog's), or does not know the
+# product; the caller then searches directly.
+def lookup_equivalents(path, table_hashes, vendor, concrete_class, product_name, bounds):
+    if not table_hashes:
+        return None
+    try:
+        meta = read_sql(path, f"SELECT key, value FROM {EQUIVALENCE_META_TABLE}")
+    except (pd.errors.DatabaseError, sqlite3.Error):
+        return None
+    meta = dict(zip(meta['key'], meta['value']))
+    if 'bounds' not in meta or json.loads(meta['bounds']) != [float(bound) for bound in bounds]:
+        return None
+    if json.loads(meta.get('table_hashes', 'null')) != dict(table_hashes):
+        return None
+    # Row keys start with "vendor|class|model number|"
+    prefix = f"{vendor}|{concrete_class}|{normalize_model_number(product_name)}|"
+    known = read_sql(path, f"SELECT 1 FROM {EQUIVALENCE_ROWS_TABLE} WHERE row_key >= ? AND row_key < ? LIMIT 1", (prefix, prefix + '\U0010ffff'))
+    if known.empty:
+        return None
+
+    edges = read_sql(path, (
+        f"SELECT target_key, target_vendor, product_name, height, mrd, vrd, mrd_type, vrd_type, source_load_case, curated "
+        f"FROM {EQUIVALENCE_TABLE} WHERE source_vendor = ? AND c = ? AND source_name_key = ? "
+        "ORDER BY curated DESC, height, mrd, vrd, product_name, source_load_case"),
+        (vendor, concrete_class, normalize_model_number(product_name)))
+    results = {}
+    for target in VENDORS:
+        if target == vendor:
+            continue
+        spec = VENDORS[target]
+        grouped = edges[edges['target_vendor'] == target].groupby('target_key', sort=False)
+        result = grouped[['product_name', 'height', 'mrd', 'vrd', *UNIFIED_LOAD_CASE_COLUMNS[:len(spec.load_case_cols)]]].first()
+        result['load_cases'] = grouped['source_load_case'].agg(lambda cases: ', '.join(dict.fromkeys(cases)))
+        result['origin'] = np.where(grouped['curated'].max().astype(bool), 'curated', 'computed')
+        result = result.reset_index(drop=True).astype({'height': float, 'mrd': float, 'vrd': float}).rename(columns={
+            'height': spec.height_col, 'mrd': spec.mrd_col, 'vrd': spec.vrd_col, **dict(zip(UNIFIED_LOAD_CASE_COLUMNS, spec.load_case_cols))})
+        results[target] = result.astype(spec.dtypes)
+    return results
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    summary = update_equivalences()
+    print(f"{EQUIVALENCE_TABLE}: {summary['changed']} of {summary['rows']} rows {'rebuilt' if summary['full'] else 'changed'}, "
+          f"{summary['edges']} edges computed in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,105 @@
+import importlib.util
+import os
+import tempfile
+
+from metrics import span
+
+# Chunked export of result frames. Rows are written a chunk at a time from
+# the raw (numeric) frame, never through format_dataframe, and the output
+# spools to a temporary file once it outgrows EXPORT_SPOOL_BYTES. Files
+# written by the CLI are copied from the spool block by block; Streamlit
+# downloads need the whole payload as bytes (export_bytes), which its media
+# file manager keeps in memory. Parquet needs pyarrow and Excel needs
+# openpyxl; formats whose package is missing are not offered.
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", 50_000))
+EXPORT_SPOOL_BYTES = 8 << 20
+EXCEL_MAX_ROWS = 1_048_575
+
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv', None),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet', 'pyarrow'),
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'openpyxl'),
+}
+
+
+def available_formats():
+    return [fmt for fmt, (_, _, package) in EXPORT_FORMATS.items() if package is None or importlib.util.find_spec(package)]
+
+
+# Always yields at least one (possibly empty) chunk, so headers get written
+def iter_chunks(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def write_csv(df, f, chunk_rows=EXPORT_CHUNK_ROWS):
+    for position, chunk in enumerate(iter_chunks(df, chunk_rows)):
+        f.write(chunk.to_csv(index=False, header=position == 0).encode("utf-8"))
+
+
+# The schema is fixed up front so every chunk is written with the same types.
+# Object columns that are empty in the first rows (e.g. load-case columns of a
+# batch that starts with Schöck products) take the type of their first value.
+def parquet_schema(df):
+    import pyarrow as pa
+
+    schema = pa.Schema.from_pandas(df.iloc[:0], preserve_index=False)
+    for position, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            valid = df[field.name].notna().to_numpy()
+            value_type = pa.infer_type([df[field.name].iat[valid.argmax()]]) if valid.any() else pa.string()
+            schema = schema.set(position, field.with_type(value_type))
+    return schema
+
+
+def write_parquet(df, f, chunk_rows=EXPORT_CHUNK_ROWS):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema(df)
+    with pq.ParquetWriter(f, schema) as writer:
+        for chunk in iter_chunks(df, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def write_excel(df, f, chunk_rows=EXPORT_CHUNK_ROWS):
+    from openpyxl import Workbook
+
+    if len(df) > EXCEL_MAX_ROWS:
+        raise ValueError(f"{len(df)} rows do not fit on one Excel sheet; export as CSV or Parquet instead")
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("alternatives")
+    sheet.append([str(column) for column in df.columns])
+    for chunk in iter_chunks(df, chunk_rows):
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(f)
+
+
+WRITERS = {'CSV': write_csv, 'Parquet': write_parquet, 'Excel': write_excel}
+
+
+# The exported file, rewound and ready to be read or served
+def export_file(df, fmt, chunk_rows=EXPORT_CHUNK_ROWS):
+    f = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    with span("export", format=fmt) as current:
+        WRITERS[fmt](df, f, chunk_rows)
+        current.add(len(df), f.tell())
+    f.seek(0)
+    return f
+
+
+# The exported file as bytes, for st.download_button
+def export_bytes(df, fmt, chunk_rows=EXPORT_CHUNK_ROWS):
+    with export_file(df, fmt, chunk_rows) as f:
+        return f.read()
+
+
+def export_name(stem, fmt):
+    return f"{stem}.{EXPORT_FORMATS[fmt][0]}"
+
+
+def export_mime(fmt):
+    return EXPORT_FORMATS[fmt][1]
+
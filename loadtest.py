@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+import streamlit
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from benchmark import generate_catalog, git_revision
+from catalog import DEFAULT_CONCRETE_CLASS, build_catalog
+
+# Load test for the Streamlit app. A local `streamlit run app.py` server is
+# started against a synthetic masterfile.db (benchmark.generate_catalog), or
+# an already running server is targeted with --url. Each simulated session
+# connects to the app's websocket the way a browser tab does and replays a
+# random mix of "Model Number" and "Specifications" queries, sending the same
+# widget states and fragment reruns as the frontend. Every level of --sessions
+# runs for --duration seconds with fresh sessions and reports throughput,
+# p50/p95 rerun latency per action, and the server's resident memory per
+# connected session.
+#
+#   python loadtest.py --sessions 1 10 50 --duration 30 --output loadtest.json
+#   QUERY_CACHE_MAX_ENTRIES=0 python loadtest.py --sessions 20   (caching off)
+#   python loadtest.py --url http://127.0.0.1:8501 --pid 4242 --db masterfile.db
+#
+# A started server inherits the environment, so cache and backend settings
+# (QUERY_CACHE_*, CATALOG_BACKEND, ...) can be compared run against run.
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+STARTUP_TIMEOUT = 120
+RERUN_TIMEOUT = 120
+INPUT_TYPE = "Choose input type:"
+MODEL_INPUT = "Input Model Number:"
+SPECS_INPUTS = ("Input mRd value:", "Input vRd value:", "Input Height value (in intervals of 10):")
+
+
+# Model numbers and (mRd, vRd, height) requirements of random catalog
+# products in the app's default concrete class
+def sample_queries(path, count, seed=0):
+    rng = random.Random(seed)
+    indexes = [index for index in build_catalog(path, version='loadtest').partitions(DEFAULT_CONCRETE_CLASS).values() if len(index.frame)]
+    names, specs = [], []
+    for _ in range(count):
+        index = rng.choice(indexes)
+        row = index.frame.iloc[rng.randrange(len(index.frame))]
+        names.append(str(row['product_name']))
+        specs.append((round(float(row[index.mrd_col]), 2), round(float(row[index.vrd_col]), 2), int(row[index.height_col])))
+    return names, specs
+
+
+# One simulated browser tab. Widgets are tracked by label: their ids and
+# fragments are learned from the elements the server sends, and every rerun
+# carries the current value of all of them, as the frontend does.
+class Session:
+    def __init__(self, url):
+        self.url = url
+        self.widgets = {}
+        self.states = {}
+        self.socket = None
+
+    async def connect(self):
+        self.socket = await websockets.connect(self.url, max_size=None)
+
+    async def close(self):
+        if self.socket is not None:
+            await self.socket.close()
+
+    # Sets a widget and waits for the rerun it triggers: a fragment rerun for
+    # widgets inside a fragment, a full one otherwise. Returns (seconds,
+    # bytes received, error or None).
+    async def rerun(self, label=None, value=None):
+        fragment_id = ""
+        if label is not None:
+            kind, widget_id, fragment_id = self.widgets[label]
+            state = WidgetState(id=widget_id)
+            if kind == 'number_input':
+                state.double_value = float(value)
+            else:
+                state.string_value = str(value)
+            self.states[label] = state
+
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        message.rerun_script.fragment_id = fragment_id
+        message.rerun_script.widget_states.widgets.extend(self.states.values())
+        start = time.perf_counter()
+        await self.socket.send(message.SerializeToString())
+        received, error = 0, None
+        while True:
+            raw = await asyncio.wait_for(self.socket.recv(), RERUN_TIMEOUT)
+            received += len(raw)
+            forward = ForwardMsg()
+            forward.ParseFromString(raw)
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type == "exception":
+                    error = element.exception.message
+                elif element_type in ("selectbox", "text_input", "number_input"):
+                    widget = getattr(element, element_type)
+                    self.widgets[widget.label] = (element_type, widget.id, forward.delta.fragment_id)
+            elif kind == "script_finished" and forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return time.perf_counter() - start, received, error
+
+
+# A session's loop until `deadline`: pick a query type, switch the input type
+# when needed, then type the query one input at a time (each input change is a
+# rerun, as in the browser). Every rerun is recorded as (action, seconds, bytes, error).
+async def run_session(url, names, specs, model_share, think_time, deadline, seed, records):
+    rng = random.Random(seed)
+    session = Session(url)
+    try:
+        await session.connect()
+        records.append(('initial', *await session.rerun()))
+        mode = "Model Number"
+        while time.perf_counter() < deadline:
+            wanted = "Model Number" if rng.random() < model_share else "Specifications"
+            if wanted != mode:
+                records.append(('switch', *await session.rerun(INPUT_TYPE, wanted)))
+                mode = wanted
+            if mode == "Model Number":
+                records.append(('model', *await session.rerun(MODEL_INPUT, rng.choice(names))))
+            else:
+                for label, value in zip(SPECS_INPUTS, rng.choice(specs)):
+                    records.append(('specs', *await session.rerun(label, value)))
+            if think_time:
+                await asyncio.sleep(rng.expovariate(1 / think_time))
+    except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as error:
+        records.append(('connection', 0.0, 0, f"{type(error).__name__}: {error}"))
+    return session
+
+
+def resident_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def latency_stats(seconds):
+    latencies = np.array(seconds) * 1000
+    return {
+        'reruns': len(latencies),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 1),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 1),
+        'max_ms': round(float(latencies.max()), 1),
+    }
+
+
+async def run_level(url, sessions, duration, names, specs, model_share, think_time, pid, seed):
+    baseline_mb = resident_mb(pid) if pid else None
+    records = []
+    start = time.perf_counter()
+    deadline = start + duration
+    connected = await asyncio.gather(*(run_session(url, names, specs, model_share, think_time, deadline, seed * 100_003 + i, records)
+                                       for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+    # Memory is read while every session is still connected
+    loaded_mb = resident_mb(pid) if pid else None
+    await asyncio.gather(*(session.close() for session in connected))
+
+    timed = [record for record in records if record[0] not in ('initial', 'connection')]
+    result = {
+        'sessions': sessions, 'seconds': round(elapsed, 2),
+        'throughput_per_s': round(len(timed) / elapsed, 2),
+        'errors': sum(1 for record in records if record[3]),
+        'received_mb': round(sum(record[2] for record in records) / (1 << 20), 2),
+        'actions': {action: latency_stats([record[1] for record in records if record[0] == action])
+                    for action in ('initial', 'switch', 'model', 'specs') if any(record[0] == action for record in records)},
+    }
+    if timed:
+        result['all'] = latency_stats([record[1] for record in timed])
+    if baseline_mb is not None and loaded_mb is not None:
+        result['server_rss_mb'] = round(loaded_mb, 1)
+        result['per_session_mb'] = round((loaded_mb - baseline_mb) / sessions, 2)
+    first_errors = [record[3] for record in records if record[3]][:3]
+    if first_errors:
+        result['first_errors'] = first_errors
+    return result
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_server(db, port):
+    env = {**os.environ, "MASTERFILE_DB": os.path.abspath(db)}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP_PATH, "--server.headless", "true", "--server.port", str(port),
+         "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"],
+        cwd=os.path.dirname(APP_PATH), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"streamlit exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=2) as response:
+                if response.status == 200:
+                    return process
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise SystemExit(f"streamlit did not start within {STARTUP_TIMEOUT}s")
+
+
+def print_report(results):
+    print(f"\n{'sessions':>8} {'reruns/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'errors':>7} {'MB/session':>11}")
+    for level in results['levels']:
+        overall = level.get('all', {})
+        print(f"{level['sessions']:8d} {level['throughput_per_s']:9.2f} {overall.get('p50_ms', 0):8.1f} {overall.get('p95_ms', 0):8.1f} "
+              f"{overall.get('max_ms', 0):8.1f} {level['errors']:7d} {level.get('per_session_mb', float('nan')):11.2f}")
+        for action, stats in level['actions'].items():
+            print(f"{'':8} {action:>9} {stats['p50_ms']:8.1f} {stats['p95_ms']:8.1f} {stats['max_ms']:8.1f}  ({stats['reruns']} reruns)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the Streamlit app with concurrent simulated sessions")
+    parser.add_argument("--sessions", nargs="+", type=int, default=[1, 5, 20], help="concurrent sessions per level")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per level")
+    parser.add_argument("--model-share", type=float, default=0.6, help="share of model-number queries (the rest are specifications)")
+    parser.add_argument("--think-time", type=float, default=0.5, help="mean pause between queries in seconds (0 for a closed loop)")
+    parser.add_argument("--scale", type=int, default=1, help="size of the synthetic catalog as a multiple of the benchmark base size")
+    parser.add_argument("--db", help="use this database instead of generating one")
+    parser.add_argument("--url", help="test a running app (e.g. http://127.0.0.1:8501) instead of starting one")
+    parser.add_argument("--pid", type=int, help="process id of the server given with --url, for memory figures")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="loadtest-results.json", help="where to save the results")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        db = args.db
+        if db is None:
+            db = os.path.join(scratch, f"masterfile-{args.scale}x.db")
+            generate_catalog(db, args.scale, args.seed)
+        names, specs = sample_queries(db, 1000, args.seed)
+
+        process, pid, url = None, args.pid, args.url
+        if url is None:
+            port = free_port()
+            print(f"Starting streamlit on port {port}...", flush=True)
+            process = start_server(db, port)
+            pid, url = process.pid, f"http://127.0.0.1:{port}"
+        stream_url = url.replace("http", "ws", 1).rstrip("/") + "/_stcore/stream"
+
+        results = {
+            'revision': git_revision(), 'created': time.strftime("%Y-%m-%dT%H:%M:%S"), 'python': platform.python_version(),
+            'streamlit': streamlit.__version__, 'database': None if args.db is None else os.path.abspath(args.db), 'scale': args.scale,
+            'duration': args.duration, 'model_share': args.model_share, 'think_time': args.think_time, 'levels': [],
+        }
+        try:
+            # One untimed session loads the catalog and warms the caches
+            asyncio.run(run_level(stream_url, 1, min(args.duration, 5), names, specs, args.model_share, 0, None, args.seed))
+            for sessions in args.sessions:
+                print(f"Running {sessions} concurrent sessions for {args.duration:g}s...", flush=True)
+                results['levels'].append(asyncio.run(run_level(
+                    stream_url, sessions, args.duration, names, specs, args.model_share, args.think_time, pid, args.seed)))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=1)
+    print_report(results)
+    print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import tempfile
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+# Lightweight timing spans around the hot paths (SQLite reads, preprocessing,
+# searches, rendering, exports). A span records its duration plus the rows and
+# bytes it processed into process-wide counters and a ring buffer of recent
+# spans. Collection is off unless PRODUCT_FINDER_METRICS=1 (or `enable()`);
+# then `span` hands out one shared no-op object and `timed` functions call
+# straight through, so the cost is a flag check per call.
+#
+# The counters are exposed in Prometheus text format (`render_prometheus`, the
+# /metrics path of server.py, or a small listener started with
+# PRODUCT_FINDER_METRICS_PORT) and in the app's Performance panel; with the
+# "product_finder.metrics" logger at DEBUG every span is also logged.
+# PRODUCT_FINDER_PROFILE=1 lets the app capture cProfile traces of single
+# reruns, written to PROFILE_DIR.
+METRICS_ENABLED = os.environ.get("PRODUCT_FINDER_METRICS", "0") == "1"
+METRICS_PORT = int(os.environ.get("PRODUCT_FINDER_METRICS_PORT", 0))
+PROFILE_ENABLED = os.environ.get("PRODUCT_FINDER_PROFILE", "0") == "1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "product-finder-profiles"))
+RECENT_SPANS = 500
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+logger = logging.getLogger("product_finder.metrics")
+
+_enabled = METRICS_ENABLED
+_lock = threading.Lock()
+# (stage, labels) -> [count, seconds, rows, bytes, max seconds, bucket counts]
+_series = {}
+_recent = deque(maxlen=RECENT_SPANS)
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+
+def enabled():
+    return _enabled
+
+
+# Rows and bytes of a frame, or of the frames in a dict or tuple. Bytes are
+# rows times the column widths (pointers for strings), which is much cheaper
+# than DataFrame.memory_usage on every span.
+def frame_size(value):
+    if isinstance(value, pd.DataFrame):
+        return len(value), len(value) * sum(getattr(dtype, 'itemsize', 8) for dtype in value.dtypes)
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        sizes = [frame_size(item) for item in value]
+        return sum(rows for rows, _ in sizes), sum(nbytes for _, nbytes in sizes)
+    return 0, 0
+
+
+class Span:
+    __slots__ = ('stage', 'labels', 'rows', 'nbytes', 'start')
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+        self.rows = 0
+        self.nbytes = 0
+
+    def add(self, rows=0, nbytes=0):
+        self.rows += rows
+        self.nbytes += nbytes
+
+    def add_frame(self, value):
+        self.add(*frame_size(value))
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.stage, self.labels, time.perf_counter() - self.start, self.rows, self.nbytes)
+
+
+class NoopSpan:
+    __slots__ = ()
+
+    def add(self, rows=0, nbytes=0):
+        pass
+
+    def add_frame(self, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+def span(stage, **labels):
+    if not _enabled:
+        return NOOP_SPAN
+    return Span(stage, tuple(sorted((key, str(value)) for key, value in labels.items())))
+
+
+# Decorator: a span around every call, counting the rows/bytes of the result
+def timed(stage):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with span(stage) as current:
+                result = function(*args, **kwargs)
+                current.add_frame(result)
+            return result
+        return wrapper
+    return decorate
+
+
+def record(stage, labels, seconds, rows=0, nbytes=0):
+    key = (stage, labels)
+    with _lock:
+        series = _series.get(key)
+        if series is None:
+            series = _series[key] = [0, 0.0, 0, 0, 0.0, [0] * len(BUCKETS)]
+        series[0] += 1
+        series[1] += seconds
+        series[2] += rows
+        series[3] += nbytes
+        series[4] = max(series[4], seconds)
+        for position, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                series[5][position] += 1
+        _recent.append((time.time(), threading.get_ident(), stage, labels, seconds, rows, nbytes))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s%s %.3f ms rows=%d bytes=%d", stage, dict(labels) or "", seconds * 1000, rows, nbytes)
+
+
+def format_labels(labels):
+    return ", ".join(f"{key}={value}" for key, value in labels)
+
+
+# Totals per stage and label set, slowest first
+def summary():
+    with _lock:
+        rows = [(stage, format_labels(labels), series[0], series[1] * 1000, series[1] * 1000 / series[0], series[4] * 1000, series[2], series[3])
+                for (stage, labels), series in _series.items()]
+    return pd.DataFrame(rows, columns=['stage', 'labels', 'count', 'total_ms', 'mean_ms', 'max_ms', 'rows', 'bytes']).sort_values(
+        'total_ms', ascending=False, ignore_index=True)
+
+
+# Spans recorded since `since` (time.time()), optionally only those of one thread
+def recent(since=0.0, thread=None):
+    with _lock:
+        entries = [entry for entry in _recent if entry[0] >= since and (thread is None or entry[1] == thread)]
+    return pd.DataFrame([(stage, format_labels(labels), seconds * 1000, rows, nbytes) for _, _, stage, labels, seconds, rows, nbytes in entries],
+                        columns=['stage', 'labels', 'ms', 'rows', 'bytes'])
+
+
+def reset():
+    with _lock:
+        _series.clear()
+        _recent.clear()
+
+
+def prometheus_labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+# Prometheus text exposition format. `gauges` maps metric names to
+# {label value: number}, e.g. {"product_finder_query_cache": query_cache.stats()}.
+def render_prometheus(gauges=None):
+    with _lock:
+        series = [(stage, labels, list(values[:5]), list(values[5])) for (stage, labels), values in sorted(_series.items())]
+    lines = [
+        "# HELP product_finder_stage_seconds Time spent per instrumented stage.",
+        "# TYPE product_finder_stage_seconds histogram",
+    ]
+    for stage, labels, (count, seconds, _, _, _), buckets in series:
+        labels = (('stage', stage), *labels)
+        for bound, bucket in zip(BUCKETS, buckets):
+            lines.append(f"product_finder_stage_seconds_bucket{prometheus_labels(labels, le=bound)} {bucket}")
+        lines.append(f"product_finder_stage_seconds_bucket{prometheus_labels(labels, le='+Inf')} {count}")
+        lines.append(f"product_finder_stage_seconds_sum{prometheus_labels(labels)} {seconds:.6f}")
+        lines.append(f"product_finder_stage_seconds_count{prometheus_labels(labels)} {count}")
+    for metric, position, help_text in (("rows", 2, "Rows processed per stage."), ("bytes", 3, "Bytes processed per stage.")):
+        lines.append(f"# HELP product_finder_stage_{metric}_total {help_text}")
+        lines.append(f"# TYPE product_finder_stage_{metric}_total counter")
+        for stage, labels, values, _ in series:
+            lines.append(f"product_finder_stage_{metric}_total{prometheus_labels((('stage', stage), *labels))} {values[position]}")
+    for metric, values in (gauges or {}).items():
+        lines.append(f"# TYPE {metric} gauge")
+        for name, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"{metric}{prometheus_labels((('stat', name),))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200 if self.path.split("?")[0] == "/metrics" else 404)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server = None
+_metrics_server_attempted = False
+
+
+# Scrape target for processes without their own HTTP server (the Streamlit
+# app): started once per process on a daemon thread. Binding is attempted only
+# once; if the port is taken (e.g. another worker of a multi-process
+# deployment already listens on it) a warning is logged and the caller keeps
+# running without a listener.
+def start_metrics_server(port=METRICS_PORT, host="127.0.0.1"):
+    global _metrics_server, _metrics_server_attempted
+    with _lock:
+        if not _metrics_server_attempted and port:
+            _metrics_server_attempted = True
+            try:
+                server = ThreadingHTTPServer((host, port), MetricsHandler)
+            except OSError as error:
+                logger.warning("metrics listener not started on %s:%d: %s", host, port, error)
+                return None
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+            _metrics_server = server
+    return _metrics_server
+
+
+def start_profile():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+# Stops the profiler, saves the trace under PROFILE_DIR (for snakeviz or
+# pstats) and returns the path and the top functions by cumulative time
+def stop_profile(profiler, name="rerun", limit=30):
+    profiler.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{threading.get_ident()}.prof")
+    profiler.dump_stats(path)
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(limit)
+    return path, text.getvalue()
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+# Process-wide cache of search results, shared by all sessions like the
+# catalog cache. Entries are keyed on the catalog version, so a rebuilt
+# catalog never serves old results; the first lookup with a new version drops
+# every entry of the previous ones. Size is bounded by entry count and by the
+# memory of the cached frames (least recently used entries go first), and
+# entries expire after a TTL.
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", 512))
+QUERY_CACHE_MAX_BYTES = int(float(os.environ.get("QUERY_CACHE_MAX_MB", 64)) * (1 << 20))
+QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", 3600))
+
+# Search windows are rounded before they are used, so bounds that differ only
+# by float noise (7.4 * 1.03) share an entry and return identical results
+WINDOW_DECIMALS = 6
+
+
+def round_window(mrd_min, mrd_max, vrd_min, vrd_max):
+    return tuple(round(float(bound), WINDOW_DECIMALS) for bound in (mrd_min, mrd_max, vrd_min, vrd_max))
+
+
+def query_key(version, vendors, concrete_class, height, windows):
+    return (version, tuple(vendors), concrete_class, None if pd.isna(height) else float(height), tuple(round_window(*window) for window in windows))
+
+
+def result_bytes(result):
+    frames = result.values() if isinstance(result, dict) else result if isinstance(result, tuple) else (result,)
+    return int(sum(frame.memory_usage(index=True, deep=True).sum() for frame in frames))
+
+
+class QueryCache:
+    def __init__(self, max_entries=QUERY_CACHE_MAX_ENTRIES, max_bytes=QUERY_CACHE_MAX_BYTES, ttl=QUERY_CACHE_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    # Cached results are shared between sessions and must not be modified
+    def get_or_compute(self, key, compute):
+        now = self.clock()
+        with self._lock:
+            if key[0] != self._version:
+                self._invalidate_locked(keep_version=key[0])
+                self._version = key[0]
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[2] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry[0]
+                self._drop(key)
+                self._stats["expirations"] += 1
+            self._stats["misses"] += 1
+
+        result = compute()
+        size = result_bytes(result)
+        with self._lock:
+            if key[0] != self._version or size > self.max_bytes:
+                return result
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (result, size, now)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+        return result
+
+    def _invalidate_locked(self, keep_version=None):
+        for key in [key for key in self._entries if key[0] != keep_version]:
+            self._drop(key)
+            self._stats["invalidations"] += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._invalidate_locked()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+            stats["max_entries"] = self.max_entries
+            stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+query_cache = QueryCache()
@@ -0,0 +1,179 @@
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+
+from catalog import UNIFIED_LOAD_CASE_COLUMNS, VENDORS, normalize_model_number, range_join
+from metrics import timed
+
+BATCH_COLUMNS = [
+    'line', 'model_number', 'input_vendor', 'load_case', 'required_mRd', 'required_vRd', 'height',
+    'vendor', 'product_name', 'mRd', 'vRd', *UNIFIED_LOAD_CASE_COLUMNS,
+]
+
+
+# One row per matched product: rows found for several load cases are kept once,
+# in catalog order, with the satisfied load cases joined into `load_cases`
+def consolidate_matches(query_ids, matches, load_cases):
+    matches = matches.assign(load_cases=np.asarray(load_cases, dtype=object)[query_ids]).sort_index(kind='mergesort')
+    satisfied = matches.groupby(level=0, sort=False)['load_cases'].agg(', '.join)
+    return matches[~matches.index.duplicated()].assign(load_cases=satisfied)
+
+
+# All load cases of one product (e.g. every mrd_type/vrd_type row of a Leviat
+# model number) searched at once over the unified index of the class, one
+# deduplicated table per vendor. `windows` holds one (mrd_min, mrd_max,
+# vrd_min, vrd_max) tuple per load case. `vendors` limits the search to some vendors.
+@timed("find_alternatives_for_load_cases")
+def find_alternatives_for_load_cases(catalog, concrete_class, height_value, windows, load_cases, vendors=None):
+    mrd_mins, mrd_maxs, vrd_mins, vrd_maxs = np.asarray(windows, dtype=float).reshape(-1, 4).T
+    heights = np.full(len(mrd_mins), float(height_value))
+    matches = catalog.search_windows(concrete_class, heights, mrd_mins, mrd_maxs, vrd_mins, vrd_maxs, vendors)
+    return {vendor: consolidate_matches(query_ids, rows, load_cases) for vendor, (query_ids, rows) in matches.items()}
+
+
+# Non-dominated points when less is better in both coordinates. After a
+# lexsort by (mRd, vRd) a point is dominated exactly when an earlier point
+# has a vRd at most as large, so one running minimum decides every point;
+# exact duplicates share the verdict of the first of their run.
+def pareto_front(mrd, vrd):
+    mrd = np.asarray(mrd, dtype=float)
+    vrd = np.asarray(vrd, dtype=float)
+    order = np.lexsort((vrd, mrd))
+    m, v = mrd[order], vrd[order]
+    previous_min = np.minimum.accumulate(np.concatenate([[np.inf], v]))[:-1]
+    run_starts = np.ones(len(order), dtype=bool)
+    run_starts[1:] = (m[1:] != m[:-1]) | (v[1:] != v[:-1])
+    first_of_run = (v < previous_min)[run_starts]
+    front = np.empty(len(order), dtype=bool)
+    front[order] = first_of_run[np.cumsum(run_starts) - 1]
+    return front
+
+
+# Products of all vendors at the given height that carry at least the required
+# load, most utilized first. `utilization` is the governing ratio
+# max(required mRd / mRd, required vRd / vRd), so 1.0 is an exact fit and
+# lower values mean more over-capacity. `pareto` marks the alternatives no
+# other product beats on both mRd and vRd over-capacity.
+@timed("rank_alternatives")
+def rank_alternatives(indexes, height_value, required_mrd, required_vrd):
+    parts = []
+    for key, index in indexes.items():
+        vendor = VENDORS[key]
+        rows = index.nearest(height_value, required_mrd, required_vrd, k=None, height_tolerance=0)
+        parts.append(pd.DataFrame({
+            'vendor': vendor.label,
+            'product_name': rows['product_name'].astype(str).to_numpy(),
+            'load_case': vendor.load_case_labels(rows),
+            'mRd': rows[vendor.mrd_col].to_numpy(dtype=float),
+            'vRd': rows[vendor.vrd_col].to_numpy(dtype=float),
+        }))
+    ranked = pd.concat(parts, ignore_index=True)
+    mrd, vrd = ranked['mRd'].to_numpy(), ranked['vRd'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ranked['utilization'] = np.maximum(float(required_mrd) / mrd, float(required_vrd) / vrd)
+    ranked['pareto'] = pareto_front(mrd, vrd)
+    return ranked.sort_values(['utilization', 'vendor', 'product_name'], ascending=[False, True, True], kind='mergesort', ignore_index=True)
+
+
+# One row per load case to search for: a product of a vendor without load
+# cases yields a single query, a product with load cases (Leviat) one query per
+# case row. Names are resolved through the name indexes and the spec rows
+# gathered with one iloc per vendor.
+def resolve_model_numbers(indexes, model_numbers):
+    keys = [normalize_model_number(model_number) for model_number in model_numbers]
+    lines = np.arange(1, len(keys) + 1)
+    resolved = []
+    for key, index in indexes.items():
+        vendor = VENDORS[key]
+        starts, stops = index.name_ranges(keys)
+        if not vendor.load_case_cols:
+            stops = np.minimum(stops, starts + 1)
+        counts = stops - starts
+        hit_lines = np.repeat(lines, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = index.frame.iloc[index.name_rows[np.repeat(starts, counts) + offsets]]
+        resolved.append(pd.DataFrame({
+            'line': hit_lines, 'input_vendor': vendor.label, 'load_case': vendor.load_case_labels(rows),
+            'required_mRd': rows[vendor.mrd_col].to_numpy(dtype=float), 'required_vRd': rows[vendor.vrd_col].to_numpy(dtype=float),
+            'height': rows[vendor.height_col].to_numpy(dtype=float, na_value=np.nan),
+        }))
+    resolved = pd.concat(resolved, ignore_index=True)
+
+    inputs = pd.DataFrame({'line': lines, 'model_number': list(model_numbers)})
+    queries = inputs.merge(resolved, on='line', how='left', sort=True)
+    queries['load_case'] = queries['load_case'].fillna('')
+    return queries
+
+
+@timed("find_alternatives_batch")
+def find_alternatives_batch(indexes, model_numbers, mrd_lower_bound, mrd_upper_bound, vrd_lower_bound, vrd_upper_bound):
+    queries = resolve_model_numbers(indexes, model_numbers)
+    required_mrd = queries['required_mRd'].to_numpy(dtype=float)
+    required_vrd = queries['required_vRd'].to_numpy(dtype=float)
+    windows = (queries['height'].to_numpy(),
+               required_mrd * mrd_lower_bound, required_mrd * mrd_upper_bound,
+               required_vrd * vrd_lower_bound, required_vrd * vrd_upper_bound)
+
+    results = []
+    matched_queries = []
+    for key, index in indexes.items():
+        vendor = VENDORS[key]
+        columns = {vendor.mrd_col: 'mRd', vendor.vrd_col: 'vRd', **dict(zip(vendor.load_case_cols, UNIFIED_LOAD_CASE_COLUMNS))}
+        query_ids, positions = range_join(index, *windows)
+        matches = index.frame.iloc[positions][['product_name', *columns]].rename(columns=columns).reset_index(drop=True)
+        matches.insert(0, 'vendor', vendor.label)
+        results.append(pd.concat([queries.iloc[query_ids].reset_index(drop=True), matches], axis=1))
+        matched_queries.append(query_ids)
+
+    # Inputs without any match still get a row so the result covers every line
+    results.append(queries[~queries.index.isin(np.concatenate(matched_queries))])
+    result = pd.concat(results, ignore_index=True).reindex(columns=BATCH_COLUMNS)
+    return result.sort_values(['line', 'load_case', 'vendor'], kind='mergesort').reset_index(drop=True)
+
+
+# Model numbers from a pasted list: one per line, blank lines are skipped
+def parse_model_numbers(text):
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+# Which model numbers any vendor lists in any concrete class
+def known_model_numbers(catalog, model_numbers):
+    keys = [normalize_model_number(model_number) for model_number in model_numbers]
+    known = np.zeros(len(keys), dtype=bool)
+    for concrete_class in catalog.concrete_classes:
+        for index in catalog.partitions(concrete_class).values():
+            starts, stops = index.name_ranges(keys)
+            known |= stops > starts
+    return known
+
+
+# Model numbers from an uploaded CSV/Excel BOM: a column called product_name
+# or model_number is used if present, otherwise the first column. Without a
+# recognised header, `header` says whether the first row is one; if it is not
+# given, the first row is taken for a header ("Part No", "Artikel", ...) when
+# `is_known` (model numbers -> bool array) rejects it but accepts a later row,
+# and it has no digits (a mistyped model number still has them).
+def read_bom_file(name, data, header=None, is_known=None):
+    if name.lower().endswith(('.xlsx', '.xls')):
+        bom = pd.read_excel(io.BytesIO(data), dtype=str, header=None)
+    else:
+        # Model numbers contain '-', so only sniff for real column separators
+        try:
+            sep = csv.Sniffer().sniff(data[:4096].decode('utf-8', 'replace'), delimiters=',;\t').delimiter
+        except csv.Error:
+            sep = ','
+        bom = pd.read_csv(io.BytesIO(data), dtype=str, sep=sep, header=None)
+    columns = {str(cell).strip().lower().replace(' ', '_'): position for position, cell in enumerate(bom.iloc[0])}
+    column = columns.get('product_name', columns.get('model_number'))
+    if column is not None and header is not False:
+        values = list(bom[column].iloc[1:].dropna())
+    else:
+        values = list(bom[0].dropna())
+        if header is None and is_known is not None and len(values) > 1:
+            known = is_known(values)
+            header = not known[0] and known[1:].any() and not any(char.isdigit() for char in values[0])
+        if header:
+            values = values[1:]
+    return [value.strip() for value in values if value.strip()]
@@ -0,0 +1,148 @@
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from catalog import SUGGESTION_LIMIT, cache_stats
+from engine import SearchEngine, to_payload
+from metrics import render_prometheus, span
+from query_cache import query_cache
+
+# Local HTTP/JSON endpoint over the search engine (start with `python cli.py
+# serve`). Connections speak HTTP/1.1 with a Content-Length on every reply, so
+# clients can keep them alive; every connection is served on its own thread
+# and all of them share the process-wide catalog and query cache.
+#
+#   GET  /health                    catalog version and cache statistics
+#   GET  /classes                   concrete classes of the catalog
+#   GET  /metrics                   Prometheus text metrics (see metrics.py)
+#   GET  /suggest?q=...&limit=10    model numbers completing or close to q
+#   GET  /search?model=...          one query from URL parameters
+#   POST /search                    one query object, or a list of them
+#
+# Queries are the dicts accepted by SearchEngine.run_query.
+SERVER_HOST = os.environ.get("PRODUCT_FINDER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.environ.get("PRODUCT_FINDER_PORT", 8765))
+MAX_BODY_BYTES = 16 << 20
+ROUTES = ("/health", "/classes", "/suggest", "/search", "/metrics")
+
+
+# A number from a URL parameter; text that is not one is passed on for
+# run_query to reject
+def parse_number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+# URL parameters as a query: bounds as "0.99,1.03,0.99,1.03", rank as 1/true
+def query_from_params(query_string):
+    query = {key: values[-1] for key, values in parse_qs(query_string).items()}
+    for key in ('mrd', 'vrd', 'height'):
+        if key in query:
+            query[key] = parse_number(query[key])
+    if 'bounds' in query:
+        query['bounds'] = [parse_number(bound) for bound in query['bounds'].split(',')]
+    if 'model_numbers' in query:
+        query['model_numbers'] = [name for name in query['model_numbers'].split(',') if name]
+    if 'rank' in query:
+        query['rank'] = query['rank'].lower() in ('1', 'true', 'yes')
+    return query
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, payload):
+        self.send_body(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    def answer(self, query):
+        engine = self.server.engine
+        try:
+            if isinstance(query, list):
+                payload = [to_payload(engine.run_query(item)) for item in query]
+            else:
+                payload = to_payload(engine.run_query(query))
+        except (TypeError, ValueError) as error:
+            self.send_json(400, {"error": str(error)})
+            return
+        self.send_json(200, payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        with span("http_request", method="GET", path=url.path if url.path in ROUTES else "other"):
+            self.route_get(url)
+
+    def route_get(self, url):
+        if url.path == "/health":
+            catalog = self.server.engine.catalog()
+            self.send_json(200, {"status": "ok", "version": catalog.version, "source": catalog.source,
+                                 "catalog_cache": cache_stats(), "query_cache": query_cache.stats()})
+        elif url.path == "/classes":
+            self.send_json(200, list(self.server.engine.catalog().concrete_classes))
+        elif url.path == "/suggest":
+            params = query_from_params(url.query)
+            try:
+                suggestions = self.server.engine.suggest(params.get('q', ''), int(params.get('limit', SUGGESTION_LIMIT)))
+            except ValueError as error:
+                self.send_json(400, {"error": str(error)})
+                return
+            self.send_json(200, to_payload(suggestions))
+        elif url.path == "/search":
+            self.answer(query_from_params(url.query))
+        elif url.path == "/metrics":
+            gauges = {"product_finder_query_cache": query_cache.stats(), "product_finder_catalog_cache": cache_stats()}
+            self.send_body(200, render_prometheus(gauges).encode("utf-8"), "text/plain; version=0.0.4")
+        else:
+            self.send_json(404, {"error": f"unknown path {url.path}"})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        with span("http_request", method="POST", path=path if path in ROUTES else "other"):
+            self.route_post()
+
+    def route_post(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length > MAX_BODY_BYTES:
+            # The body is not read, so the connection cannot be reused
+            self.close_connection = True
+            self.send_json(413, {"error": f"request bodies are limited to {MAX_BODY_BYTES} bytes"})
+            return
+        body = self.rfile.read(length)
+        if urlparse(self.path).path != "/search":
+            self.send_json(404, {"error": f"unknown path {urlparse(self.path).path}"})
+            return
+        try:
+            query = json.loads(body)
+        except ValueError as error:
+            self.send_json(400, {"error": f"invalid JSON: {error}"})
+            return
+        self.answer(query)
+
+
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, engine):
+        super().__init__(address, QueryHandler)
+        self.engine = engine
+
+
+def serve(engine=None, host=SERVER_HOST, port=SERVER_PORT):
+    engine = engine or SearchEngine()
+    # Load the catalog before the first request arrives
+    engine.catalog()
+    with QueryServer((host, port), engine) as server:
+        print(f"Serving product searches on http://{host}:{server.server_port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,113 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Columnar catalog snapshot: one .npy file per column (categorical columns as
+# codes, nullable integers as values plus mask), named index arrays, and a
+# manifest.json that records the column layout, the catalog's partition layout
+# and the source database the snapshot was built from. Arrays are opened with
+# mmap_mode='r', so every worker process maps the same pages instead of
+# holding its own copy. That holds for numeric, categorical, nullable and
+# index arrays; plain string columns (Schöck's product_name) are stored
+# dictionary-encoded but decoded into an object array per process, since
+# pandas keeps Python strings and cannot point into a mapped file. Those names
+# are nearly all distinct, so keeping codes plus categories would not save
+# that memory either.
+#
+# pyarrow is installed (Streamlit requires it and export.py uses it); the
+# arrays are plain .npy rather than Arrow IPC because np.load hands back
+# ndarrays that pandas wraps without a copy, whereas Table.to_pandas copies
+# dictionary and null-bearing columns and the class partitions would no
+# longer be slices of the mapped files.
+SNAPSHOT_FORMAT = 2
+
+
+# `arrays` maps names to plain ndarrays stored next to the tables;
+# `partitions` is any JSON-serializable layout kept in the manifest
+def write_snapshot(snapshot_dir, tables, source, arrays=None, partitions=None):
+    parent = os.path.dirname(os.path.abspath(snapshot_dir))
+    staging = tempfile.mkdtemp(prefix='.snapshot-', dir=parent)
+    manifest = {'format': SNAPSHOT_FORMAT, 'source': source, 'tables': {}, 'arrays': {}, 'partitions': partitions or {}}
+
+    for table, df in tables.items():
+        os.mkdir(os.path.join(staging, table))
+        columns = []
+        for position, column in enumerate(df.columns):
+            values = df[column]
+            stem = os.path.join(table, str(position))
+            entry = {'name': column, 'file': stem + '.npy'}
+            if isinstance(values.dtype, pd.CategoricalDtype) or pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+                # Plain string columns are stored dictionary-encoded as well
+                entry['kind'] = 'categorical' if isinstance(values.dtype, pd.CategoricalDtype) else 'strings'
+                values = values.astype('category')
+                entry['categories'] = values.cat.categories.astype(str).tolist()
+                array = values.cat.codes.to_numpy()
+            elif pd.api.types.is_extension_array_dtype(values):
+                entry['kind'] = 'nullable'
+                entry['dtype'] = str(values.dtype)
+                entry['mask'] = stem + '.mask.npy'
+                np.save(os.path.join(staging, entry['mask']), values.isna().to_numpy())
+                array = values.to_numpy(dtype=values.dtype.numpy_dtype, na_value=0)
+            else:
+                entry['kind'] = 'numpy'
+                array = values.to_numpy()
+            np.save(os.path.join(staging, entry['file']), array)
+            columns.append(entry)
+        manifest['tables'][table] = {'rows': len(df), 'columns': columns}
+
+    if arrays:
+        os.mkdir(os.path.join(staging, 'arrays'))
+    for position, (name, array) in enumerate((arrays or {}).items()):
+        manifest['arrays'][name] = os.path.join('arrays', f"{position}.npy")
+        np.save(os.path.join(staging, manifest['arrays'][name]), array)
+
+    with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    # Swap the finished directory in place so readers never see a partial snapshot
+    if os.path.exists(snapshot_dir):
+        retired = snapshot_dir + '.old'
+        shutil.rmtree(retired, ignore_errors=True)
+        os.replace(snapshot_dir, retired)
+        os.replace(staging, snapshot_dir)
+        shutil.rmtree(retired, ignore_errors=True)
+    else:
+        os.replace(staging, snapshot_dir)
+    return manifest
+
+
+def read_manifest(snapshot_dir):
+    try:
+        with open(os.path.join(snapshot_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('format') == SNAPSHOT_FORMAT else None
+
+
+def read_snapshot(snapshot_dir, manifest):
+    tables = {}
+    for table, layout in manifest['tables'].items():
+        columns = {}
+        for entry in layout['columns']:
+            array = np.load(os.path.join(snapshot_dir, entry['file']), mmap_mode='r')
+            if entry['kind'] == 'categorical':
+                columns[entry['name']] = pd.Categorical.from_codes(array, entry['categories'])
+            elif entry['kind'] == 'strings':
+                categories = np.array(entry['categories'] + [None], dtype=object)
+                columns[entry['name']] = categories[array]
+            elif entry['kind'] == 'nullable':
+                mask = np.load(os.path.join(snapshot_dir, entry['mask']), mmap_mode='r')
+                columns[entry['name']] = pd.api.types.pandas_dtype(entry['dtype']).construct_array_type()(array, mask)
+            else:
+                columns[entry['name']] = array
+        tables[table] = pd.DataFrame(columns, copy=False)
+    return tables
+
+
+def read_arrays(snapshot_dir, manifest):
+    return {name: np.load(os.path.join(snapshot_dir, file), mmap_mode='r') for name, file in manifest['arrays'].items()}
@@ -0,0 +1,376 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from catalog import (DEFAULT_CONCRETE_CLASS, NEAREST_HEIGHT_TOLERANCE, NEAREST_K, SUGGESTION_LIMIT, UNIFIED_LOAD_CASE_COLUMNS, VENDORS,
+                     build_catalog, build_name_index, db_path, normalize_model_number, normalize_model_numbers)
+from metrics import span
+
+# Query engine that answers alternative-product searches inside masterfile.db
+# instead of in pandas. `materialize_catalog` writes the preprocessed rows of
+# every registered vendor into one table in the unified schema, indexed on
+# (vendor, c, height, mRd), so a search reads only the matching rows. `seq` is
+# the row's position in the in-memory vendor frame; ordering by it returns
+# rows in the same order, with the same index labels, as HeightIndex.query.
+#
+# Staleness is detected inside SQLite, without reading the vendor tables:
+# triggers on every vendor table bump a change counter in
+# catalog_normalized_meta, which also records the counter and the row counts
+# the rows were built from. A vendor table that was changed, or dropped and
+# recreated (which drops its triggers), makes get_sql_catalog raise until the
+# build step runs again, rather than loading the whole catalog into memory.
+# `python sql_engine.py check` compares the SQL and in-memory paths.
+NORMALIZED_TABLE = "catalog_normalized"
+NORMALIZED_META_TABLE = "catalog_normalized_meta"
+CHANGE_COUNTER = "vendor_table_changes"
+TRIGGER_EVENTS = ("INSERT", "UPDATE", "DELETE")
+
+SELECT_COLUMNS = "seq, vendor, c, product_name, height, mrd, vrd, mrd_type, vrd_type"
+
+
+def normalized_rows(vendor, df):
+    spec = VENDORS[vendor]
+    rows = pd.DataFrame({
+        'vendor': vendor,
+        'c': df['c'].astype(str),
+        'product_name': df['product_name'].astype(str),
+        'name_key': normalize_model_numbers(df['product_name']),
+        'height': df[spec.height_col].astype(float),
+        'mrd': df[spec.mrd_col].astype(float),
+        'vrd': df[spec.vrd_col].astype(float),
+        'mrd_type': None,
+        'vrd_type': None,
+        'seq': df.index,
+    })
+    for column, unified in zip(spec.load_case_cols, UNIFIED_LOAD_CASE_COLUMNS):
+        rows[unified] = df[column]
+    return rows
+
+
+def vendor_tables():
+    return [table for vendor in VENDORS.values() for table in vendor.tables]
+
+
+def trigger_name(table, event):
+    return f"{NORMALIZED_TABLE}_{table}_{event.lower()}"
+
+
+# Installs the change triggers where missing and returns the current counter
+def install_change_triggers(conn):
+    with conn:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {NORMALIZED_META_TABLE} (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute(f"INSERT OR IGNORE INTO {NORMALIZED_META_TABLE} VALUES (?, '0')", (CHANGE_COUNTER,))
+        for table in vendor_tables():
+            for event in TRIGGER_EVENTS:
+                conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {trigger_name(table, event)} AFTER {event} ON {table} BEGIN "
+                    f"UPDATE {NORMALIZED_META_TABLE} SET value = CAST(value AS INTEGER) + 1 WHERE key = '{CHANGE_COUNTER}'; END")
+    return int(conn.execute(f"SELECT value FROM {NORMALIZED_META_TABLE} WHERE key = ?", (CHANGE_COUNTER,)).fetchone()[0])
+
+
+# Build step: (re)create catalog_normalized from the vendor tables. The new
+# table is filled under a temporary name and swapped in one transaction,
+# together with the signatures of the tables it was built from and the change
+# counter read before they were loaded, so a change made during the build
+# leaves the table stale rather than looking current.
+def materialize_catalog(path=None):
+    path = path or db_path
+    conn = sqlite3.connect(path)
+    try:
+        changes = install_change_triggers(conn)
+        catalog = build_catalog(path)
+        rows = pd.concat([normalized_rows(vendor, frame) for vendor, frame in catalog.frames.items()], ignore_index=True)
+        rows.to_sql(NORMALIZED_TABLE + "_new", conn, if_exists='replace', index=False)
+        with conn:
+            conn.execute(f"DROP TABLE IF EXISTS {NORMALIZED_TABLE}")
+            conn.execute(f"ALTER TABLE {NORMALIZED_TABLE}_new RENAME TO {NORMALIZED_TABLE}")
+            conn.execute(f"CREATE INDEX {NORMALIZED_TABLE}_range ON {NORMALIZED_TABLE} (vendor, c, height, mrd, vrd)")
+            conn.execute(f"CREATE INDEX {NORMALIZED_TABLE}_unified ON {NORMALIZED_TABLE} (c, height, mrd, vrd)")
+            conn.execute(f"CREATE INDEX {NORMALIZED_TABLE}_name ON {NORMALIZED_TABLE} (vendor, c, name_key)")
+            conn.execute(f"INSERT OR REPLACE INTO {NORMALIZED_META_TABLE} VALUES ('table_hashes', ?)",
+                         (json.dumps(catalog.table_hashes, sort_keys=True),))
+            conn.execute(f"INSERT OR REPLACE INTO {NORMALIZED_META_TABLE} VALUES ('built_changes', ?)", (str(changes),))
+    finally:
+        conn.close()
+    return len(rows)
+
+
+# One read-only connection per database and process, shared by all sessions.
+# sqlite3 connections are not safe for concurrent use, so calls are serialized.
+# A database file replaced by rename gets a new connection; the old one is
+# left to queries still running on it and closed when it is collected.
+_pool_lock = threading.Lock()
+_connections = {}
+# Database version -> NameIndex, built on the first suggestion
+_name_indexes = {}
+
+
+def read_connection(path):
+    path = os.path.abspath(path)
+    inode = os.stat(path).st_ino
+    with _pool_lock:
+        entry = _connections.get(path)
+        if entry is None or entry[2] != inode:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            entry = _connections[path] = (conn, threading.Lock(), inode)
+        return entry
+
+
+def read_sql(path, query, params=()):
+    conn, lock, _ = read_connection(path)
+    with span("sql_query") as current, lock:
+        rows = pd.read_sql_query(query, conn, params=params)
+        current.add_frame(rows)
+    return rows
+
+
+# Rows read back from catalog_normalized in the vendor's own column names and dtypes
+def vendor_frame(vendor, rows):
+    spec = VENDORS[vendor]
+    rows = rows.astype({'seq': 'int64', 'height': float, 'mrd': float, 'vrd': float})
+    unused = list(UNIFIED_LOAD_CASE_COLUMNS[len(spec.load_case_cols):])
+    frame = rows.drop(columns=['vendor', *unused]).set_index('seq').rename_axis(None).rename(columns={
+        'height': spec.height_col, 'mrd': spec.mrd_col, 'vrd': spec.vrd_col,
+        **dict(zip(UNIFIED_LOAD_CASE_COLUMNS, spec.load_case_cols))})
+    return frame.astype(spec.dtypes)
+
+
+# SQL counterpart of HeightIndex: one vendor and concrete class, same methods
+class SqlIndex:
+    def __init__(self, path, vendor, concrete_class):
+        self.path = path
+        self.vendor = vendor
+        self.concrete_class = concrete_class
+        spec = VENDORS[vendor]
+        self.height_col, self.mrd_col, self.vrd_col = spec.height_col, spec.mrd_col, spec.vrd_col
+
+    def to_frame(self, rows):
+        return vendor_frame(self.vendor, rows)
+
+    def query(self, height, mrd_min, mrd_max, vrd_min, vrd_max):
+        rows = read_sql(self.path, (
+            f"SELECT {SELECT_COLUMNS} FROM {NORMALIZED_TABLE} "
+            "WHERE vendor = ? AND c = ? AND height = ? AND mrd BETWEEN ? AND ? AND vrd BETWEEN ? AND ? ORDER BY seq"),
+            (self.vendor, self.concrete_class, float(height), float(mrd_min), float(mrd_max), float(vrd_min), float(vrd_max)))
+        return self.to_frame(rows)
+
+    # Same candidates and ranking as HeightIndex.nearest, ordered by the squared
+    # relative distance inside SQLite
+    def nearest(self, height, mrd, vrd, k=NEAREST_K, height_tolerance=NEAREST_HEIGHT_TOLERANCE):
+        if pd.isna(height):
+            height = float('nan')
+        scales = [max(abs(float(value)), 1e-9) for value in (mrd, vrd, height)]
+        rows = read_sql(self.path, (
+            f"SELECT {SELECT_COLUMNS}, "
+            "((mrd - ?) / ?) * ((mrd - ?) / ?) + ((vrd - ?) / ?) * ((vrd - ?) / ?) + ((height - ?) / ?) * ((height - ?) / ?) AS distance "
+            f"FROM {NORMALIZED_TABLE} WHERE vendor = ? AND c = ? AND height BETWEEN ? AND ? AND mrd >= ? AND vrd >= ? "
+            "ORDER BY distance, seq LIMIT ?"),
+            (float(mrd), scales[0]) * 2 + (float(vrd), scales[1]) * 2 + (float(height), scales[2]) * 2 +
+            (self.vendor, self.concrete_class, float(height) - height_tolerance, float(height) + height_tolerance, float(mrd), float(vrd),
+             -1 if k is None else int(k)))
+        rows['distance'] = np.sqrt(rows['distance'].astype(float))
+        return self.to_frame(rows)
+
+    def lookup(self, product_name):
+        rows = read_sql(self.path, (
+            f"SELECT {SELECT_COLUMNS} FROM {NORMALIZED_TABLE} "
+            "WHERE vendor = ? AND c = ? AND name_key = ? ORDER BY seq"),
+            (self.vendor, self.concrete_class, normalize_model_number(product_name)))
+        return self.to_frame(rows)
+
+    def canonical_name(self, product_name):
+        rows = self.lookup(product_name)
+        return None if rows.empty else rows['product_name'].iat[0]
+
+
+class SqlCatalog:
+    def __init__(self, path, table_hashes):
+        self.path = os.path.abspath(path)
+        self.source = 'sqlite-query'
+        # Signatures of the vendor tables catalog_normalized was built from
+        self.table_hashes = table_hashes
+        # Changes whenever the database file is rewritten (e.g. re-materialized)
+        stat = os.stat(self.path)
+        self.version = f"sqlite-{stat.st_mtime_ns}-{stat.st_size}"
+        self.concrete_classes = tuple(sorted(
+            read_sql(self.path, f"SELECT DISTINCT c FROM {NORMALIZED_TABLE}")['c'], key=lambda c: (len(c), c)))
+
+    def partitions(self, concrete_class=DEFAULT_CONCRETE_CLASS):
+        return {vendor: SqlIndex(self.path, vendor, concrete_class) for vendor in VENDORS}
+
+    def split_vendors(self, rows, vendors=None):
+        return {vendor: rows[rows['vendor'] == vendor] for vendor in (VENDORS if vendors is None else vendors)}
+
+    # Several windows over all vendors in one statement: the windows are joined
+    # against the range index and every row carries the id of its window.
+    # `vendors` limits the statement to some vendors.
+    def search_windows(self, concrete_class, heights, mrd_mins, mrd_maxs, vrd_mins, vrd_maxs, vendors=None):
+        windows = [(query_id, *map(float, window)) for query_id, window in enumerate(zip(heights, mrd_mins, mrd_maxs, vrd_mins, vrd_maxs))]
+        vendors = list(VENDORS if vendors is None else vendors)
+        rows = read_sql(self.path, (
+            f"WITH windows (query_id, height, mrd_min, mrd_max, vrd_min, vrd_max) AS (VALUES {', '.join(['(?, ?, ?, ?, ?, ?)'] * len(windows))}) "
+            f"SELECT w.query_id, {', '.join('n.' + column for column in SELECT_COLUMNS.split(', '))} FROM windows w JOIN {NORMALIZED_TABLE} n "
+            f"ON n.c = ? AND n.vendor IN ({', '.join('?' * len(vendors))}) AND n.height = w.height AND n.mrd BETWEEN w.mrd_min AND w.mrd_max "
+            "AND n.vrd BETWEEN w.vrd_min AND w.vrd_max ORDER BY w.query_id, n.seq"),
+            (*[value for window in windows for value in window], concrete_class, *vendors))
+        return {vendor: (part['query_id'].to_numpy(dtype=np.int64), vendor_frame(vendor, part.drop(columns='query_id')))
+                for vendor, part in self.split_vendors(rows, vendors).items()}
+
+    def search(self, concrete_class, height, mrd_min, mrd_max, vrd_min, vrd_max):
+        rows = read_sql(self.path, (
+            f"SELECT {SELECT_COLUMNS} FROM {NORMALIZED_TABLE} "
+            "WHERE c = ? AND height = ? AND mrd BETWEEN ? AND ? AND vrd BETWEEN ? AND ? ORDER BY seq"),
+            (concrete_class, float(height), float(mrd_min), float(mrd_max), float(vrd_min), float(vrd_max)))
+        return {vendor: vendor_frame(vendor, part) for vendor, part in self.split_vendors(rows).items()}
+
+    def query_classes(self, concrete_classes, height, mrd_min, mrd_max, vrd_min, vrd_max):
+        rows = read_sql(self.path, (
+            f"SELECT {SELECT_COLUMNS} FROM {NORMALIZED_TABLE} "
+            f"WHERE c IN ({', '.join('?' * len(concrete_classes))}) "
+            "AND height = ? AND mrd BETWEEN ? AND ? AND vrd BETWEEN ? AND ? ORDER BY seq"),
+            (*concrete_classes, float(height), float(mrd_min), float(mrd_max), float(vrd_min), float(vrd_max)))
+        return {vendor: vendor_frame(vendor, part) for vendor, part in self.split_vendors(rows).items()}
+
+    # Suggestions come from the same sorted name index as the in-memory
+    # catalog, built once per database version from the distinct names
+    def suggest(self, text, limit=SUGGESTION_LIMIT):
+        index = _name_indexes.get(self.version)
+        if index is None:
+            names = read_sql(self.path, f"SELECT DISTINCT vendor, product_name FROM {NORMALIZED_TABLE}")
+            index = build_name_index({vendor: part for vendor, part in self.split_vendors(names).items()})
+            with _pool_lock:
+                _name_indexes.clear()
+                _name_indexes[self.version] = index
+        return index.suggest(text, limit)
+
+
+# Signatures of the vendor tables catalog_normalized was built from. Raises
+# RuntimeError if it was never built or the vendor tables changed since: no
+# change counted by the triggers, all triggers in place on their own tables and
+# the same row counts.
+def materialized_hashes(path):
+    try:
+        meta = dict(read_sql(path, f"SELECT key, value FROM {NORMALIZED_META_TABLE}").itertuples(index=False))
+        # Object name -> the table it belongs to (a table's own name for tables)
+        schema = dict(read_sql(path, "SELECT name, tbl_name FROM sqlite_master WHERE type IN ('table', 'trigger')").itertuples(index=False))
+    except (pd.errors.DatabaseError, sqlite3.Error):
+        meta, schema = {}, {}
+    if NORMALIZED_TABLE not in schema or not {'table_hashes', 'built_changes', CHANGE_COUNTER} <= meta.keys():
+        problem = "it has not been built"
+    elif any(schema.get(trigger_name(table, event)) != table for table in vendor_tables() for event in TRIGGER_EVENTS):
+        problem = "a vendor table was replaced since it was built"
+    elif meta[CHANGE_COUNTER] != meta['built_changes']:
+        problem = "the vendor tables changed since it was built"
+    else:
+        hashes = json.loads(meta['table_hashes'])
+        counts = read_sql(path, " UNION ALL ".join(f"SELECT '{table}' AS name, COUNT(*) AS n FROM {table}" for table in vendor_tables()))
+        current = {name: str(count) for name, count in counts.itertuples(index=False)}
+        if set(hashes) != set(current) or any(hashes[table].split(':')[0] != current[table] for table in current):
+            problem = "the vendor tables changed since it was built"
+        else:
+            return hashes
+    raise RuntimeError(f"{NORMALIZED_TABLE} in {path} cannot be searched: {problem}; run `python sql_engine.py --db {path}` to rebuild it")
+
+
+# Database path -> ((mtime, size), SqlCatalog). catalog_normalized is checked
+# again only when the database file changes.
+_sql_catalogs = {}
+
+
+def get_sql_catalog(path=None):
+    path = os.path.abspath(path or db_path)
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    entry = _sql_catalogs.get(path)
+    if entry is None or entry[0] != signature:
+        entry = _sql_catalogs[path] = (signature, SqlCatalog(path, materialized_hashes(path)))
+    return entry[1]
+
+
+# Results are compared as the engine returns them: the vendor's result
+# columns (plus the distance of nearest matches), by value and index label.
+# Categorical columns of the in-memory frames come back as plain values.
+def results_equal(vendor, a, b):
+    columns = [*VENDORS[vendor].result_columns, *(['distance'] if 'distance' in a else [])]
+    a, b = (frame[columns].astype({column: object for column in columns if isinstance(frame[column].dtype, pd.CategoricalDtype)})
+            for frame in (a, b))
+    try:
+        pd.testing.assert_frame_equal(a, b, check_dtype=False, check_categorical=False)
+    except AssertionError:
+        return False
+    return True
+
+
+# Parity of the SQL and in-memory paths: search, search_windows, query_classes
+# and the per-vendor nearest/lookup on windows around random catalog rows.
+# Returns the number of checks and a list of the mismatches.
+def check_parity(path=None, windows=200, seed=0):
+    path = path or db_path
+    memory = build_catalog(path)
+    try:
+        sql = get_sql_catalog(path)
+    except RuntimeError as error:
+        raise SystemExit(str(error))
+    rng = random.Random(seed)
+    checks, mismatches = 0, []
+    for _ in range(windows):
+        concrete_class = rng.choice(memory.concrete_classes)
+        indexes = memory.partitions(concrete_class)
+        vendor = rng.choice([key for key, index in indexes.items() if len(index.frame)])
+        index = indexes[vendor]
+        row = index.frame.iloc[rng.randrange(len(index.frame))]
+        height, mrd, vrd = float(row[index.height_col]), float(row[index.mrd_col]), float(row[index.vrd_col])
+        factors = sorted(rng.uniform(0.8, 1.2) for _ in range(4))
+        window = (height, mrd * factors[0], mrd * factors[3], vrd * factors[1], vrd * factors[2])
+        label = f"{concrete_class} {vendor} {row['product_name']} {window}"
+
+        expected, found = memory.search(concrete_class, *window), sql.search(concrete_class, *window)
+        expected_windows = memory.search_windows(concrete_class, *([value, value] for value in window))
+        found_windows = sql.search_windows(concrete_class, *([value, value] for value in window))
+        expected_classes = memory.query_classes(memory.concrete_classes, *window)
+        found_classes = sql.query_classes(memory.concrete_classes, *window)
+        sql_indexes = sql.partitions(concrete_class)
+        for key in VENDORS:
+            results = [
+                ('search', expected[key], found[key]),
+                ('search_windows', expected_windows[key][1], found_windows[key][1]),
+                ('query_classes', expected_classes[key], found_classes[key]),
+                ('nearest', indexes[key].nearest(height, mrd, vrd), sql_indexes[key].nearest(height, mrd, vrd)),
+                ('lookup', indexes[key].lookup(row['product_name']), sql_indexes[key].lookup(row['product_name'])),
+            ]
+            if not np.array_equal(expected_windows[key][0], found_windows[key][0]):
+                mismatches.append(f"search_windows query ids [{key}] {label}")
+            for name, a, b in results:
+                checks += 1
+                if not results_equal(key, a, b):
+                    mismatches.append(f"{name} [{key}] {label}")
+    return checks, mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQL query engine for the Product Finder App")
+    parser.add_argument("command", nargs="?", choices=["materialize", "check"], default="materialize",
+                        help=f"build {NORMALIZED_TABLE} (default) or compare SQL and in-memory results")
+    parser.add_argument("--db", default=db_path, help="path to masterfile.db")
+    parser.add_argument("--windows", type=int, default=200, help="random search windows to compare")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "materialize":
+        count = materialize_catalog(args.db)
+        print(f"{NORMALIZED_TABLE}: {count} rows materialized in {time.perf_counter() - start:.2f}s")
+    else:
+        checks, mismatches = check_parity(args.db, args.windows, args.seed)
+        for mismatch in mismatches[:20]:
+            print("MISMATCH", mismatch)
+        print(f"{checks - len(mismatches)} of {checks} results identical in {time.perf_counter() - start:.2f}s")
+        if mismatches:
+            raise SystemExit(1)
@@ -0,0 +1,45 @@
+import os
+import shutil
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import generate_catalog  # noqa: E402
+import catalog  # noqa: E402
+
+LEVIAT_TABLE = "final_file_extended_columns_HIT_HP"
+
+
+# One synthetic masterfile.db at 1x per session; every test gets its own copy
+@pytest.fixture(scope="session")
+def generated_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("generated") / "masterfile.db")
+    generate_catalog(path, 1, seed=0)
+    return path
+
+
+@pytest.fixture
+def db(generated_db, tmp_path):
+    path = str(tmp_path / "masterfile.db")
+    shutil.copyfile(generated_db, path)
+    yield path
+    catalog.clear_cache()
+
+
+# Run a statement against the database and move its mtime forward, so the
+# (mtime, size) signatures see the change even within one clock tick
+@pytest.fixture
+def modify():
+    def run(path, statement=f"UPDATE {LEVIAT_TABLE} SET vRd_plus = vRd_plus + 5 WHERE rowid <= 30"):
+        stat = os.stat(path)
+        conn = sqlite3.connect(path)
+        try:
+            with conn:
+                conn.execute(statement)
+        finally:
+            conn.close()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    return run
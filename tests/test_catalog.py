@@ -0,0 +1,108 @@
+import os
+import threading
+
+import numpy as np
+
+import catalog
+from catalog import VENDORS, build_catalog, build_snapshot, load_snapshot_catalog, refresh_catalog
+
+
+def signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def test_refresh_rebuilds_only_the_changed_vendor(db, modify):
+    current = build_catalog(db)
+    assert refresh_catalog(current, db) == (current, [])
+
+    modify(db)
+    refreshed, changed = refresh_catalog(current, db)
+    assert changed == ['leviat']
+    assert refreshed.frames['schoeck'] is current.frames['schoeck']
+    assert refreshed.vendor_partitions['schoeck'] is current.vendor_partitions['schoeck']
+    rebuilt = build_catalog(db)
+    assert refreshed.table_hashes == rebuilt.table_hashes
+    for vendor in VENDORS:
+        assert refreshed.frames[vendor].equals(rebuilt.frames[vendor])
+    for concrete_class in rebuilt.concrete_classes:
+        window = ([200.0], [0.0], [1000.0], [0.0], [1000.0])
+        expected = rebuilt.search_windows(concrete_class, *window)
+        for vendor, (query_ids, rows) in refreshed.search_windows(concrete_class, *window).items():
+            assert np.array_equal(query_ids, expected[vendor][0])
+            assert rows.equals(expected[vendor][1])
+
+
+def test_blocking_get_catalog_waits_for_the_running_refresh(db, modify, monkeypatch):
+    original = catalog.get_catalog(db)
+    modify(db)
+    started, release = threading.Event(), threading.Event()
+    refresh = catalog.refresh_catalog
+
+    def gated_refresh(current, path=None):
+        started.set()
+        release.wait(10)
+        return refresh(current, path)
+
+    monkeypatch.setattr(catalog, 'refresh_catalog', gated_refresh)
+    refreshes = catalog.cache_stats()['refreshes']
+    # The first caller after the change starts the refresh in the background
+    assert catalog.get_catalog(db) is original
+    assert started.wait(10)
+
+    result = {}
+    waiter = threading.Thread(target=lambda: result.setdefault('catalog', catalog.get_catalog(db, block=True)))
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive()
+    release.set()
+    waiter.join(10)
+
+    assert result['catalog'] is not original
+    assert result['catalog'].table_hashes == build_catalog(db).table_hashes
+    assert catalog.cache_stats()['refreshes'] == refreshes + 1
+    assert catalog.get_catalog(db) is result['catalog']
+
+
+def test_concurrent_misses_build_once(db, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    build = catalog.build_catalog
+
+    def gated_build(path=None, version=None):
+        started.set()
+        release.wait(10)
+        return build(path, version)
+
+    monkeypatch.setattr(catalog, 'build_catalog', gated_build)
+    builds = catalog.cache_stats()['builds']
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(catalog.get_catalog(db, block=True))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(10)
+    release.set()
+    for thread in threads:
+        thread.join(10)
+
+    assert len(results) == 3 and all(result is results[0] for result in results)
+    assert catalog.cache_stats()['builds'] == builds + 1
+
+
+def test_snapshot_loads_the_built_catalog(db):
+    built = build_catalog(db)
+    build_snapshot(db)
+    loaded = load_snapshot_catalog(db, signature(db))
+    assert loaded.source == 'snapshot'
+    assert loaded.table_hashes == built.table_hashes
+    for vendor in VENDORS:
+        assert loaded.frames[vendor].equals(built.frames[vendor])
+        for concrete_class, index in built.vendor_partitions[vendor].items():
+            name = index.frame['product_name'].iloc[len(index.frame) // 2]
+            assert loaded.vendor_partitions[vendor][concrete_class].lookup(name).equals(index.lookup(name))
+    heights = np.repeat([180.0, 200.0, 230.0], 2)
+    window = (heights, np.full(6, 10.0), np.full(6, 80.0), np.full(6, 20.0), np.full(6, 120.0))
+    for concrete_class in built.concrete_classes:
+        expected = built.search_windows(concrete_class, *window)
+        for vendor, (query_ids, rows) in loaded.search_windows(concrete_class, *window).items():
+            assert np.array_equal(query_ids, expected[vendor][0])
+            assert rows.equals(expected[vendor][1])
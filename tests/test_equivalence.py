@@ -0,0 +1,50 @@
+import shutil
+
+import pandas as pd
+
+from catalog import build_catalog
+from equivalence import EQUIVALENCE_BOUNDS, EQUIVALENCE_TABLE, lookup_equivalents, update_equivalences
+from sql_engine import read_sql
+
+SCHOECK_TABLE = "updated_Isokorb_T_full_columns"
+
+
+def stored_edges(path):
+    edges = read_sql(path, f"SELECT * FROM {EQUIVALENCE_TABLE}")
+    return edges.sort_values(list(edges.columns), ignore_index=True)
+
+
+def test_incremental_update_matches_a_full_rebuild(db, modify, tmp_path):
+    assert update_equivalences(db)['full']
+    modify(db)
+    modify(db, f"UPDATE {SCHOECK_TABLE} SET C = 'C30/37' WHERE rowid <= 20")
+    modify(db, "DELETE FROM final_file_extended_columns_HIT_SP WHERE rowid BETWEEN 100 AND 111")
+
+    summary = update_equivalences(db)
+    assert not summary['full']
+    assert 0 < summary['changed'] < summary['rows']
+
+    rebuilt = str(tmp_path / "rebuilt.db")
+    shutil.copyfile(db, rebuilt)
+    assert update_equivalences(rebuilt, full=True)['full']
+    pd.testing.assert_frame_equal(stored_edges(db), stored_edges(rebuilt))
+
+
+# The table is only trusted for the vendor tables and bounds it was built from
+def test_lookup_trusts_only_a_matching_build(db, modify):
+    update_equivalences(db)
+    name = read_sql(db, "SELECT schoeck_product FROM product_mapping LIMIT 1")['schoeck_product'][0]
+    built = build_catalog(db)
+    frame = built.frames['schoeck']
+    concrete_class = frame.loc[frame['product_name'] == name, 'c'].iloc[0]
+
+    found = lookup_equivalents(db, built.table_hashes, 'schoeck', concrete_class, name, EQUIVALENCE_BOUNDS)
+    assert found is not None and (found['leviat']['origin'] == 'curated').any()
+    assert lookup_equivalents(db, built.table_hashes, 'schoeck', concrete_class, name, (0.9, 1.1, 0.9, 1.1)) is None
+    assert lookup_equivalents(db, built.table_hashes, 'schoeck', concrete_class, 'T-NOT-A-PRODUCT', EQUIVALENCE_BOUNDS) is None
+
+    modify(db)
+    changed = build_catalog(db)
+    assert lookup_equivalents(db, changed.table_hashes, 'schoeck', concrete_class, name, EQUIVALENCE_BOUNDS) is None
+    update_equivalences(db)
+    assert lookup_equivalents(db, changed.table_hashes, 'schoeck', concrete_class, name, EQUIVALENCE_BOUNDS) is not None
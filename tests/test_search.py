@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from catalog import VENDORS, build_catalog, range_join
+from search import pareto_front
+
+
+@pytest.fixture(scope="module")
+def built(generated_db):
+    return build_catalog(generated_db)
+
+
+# Query windows around random catalog rows, plus heights the index lacks
+def random_windows(rng, heights, mrd, vrd, count=300):
+    picks = rng.integers(0, len(heights), count)
+    query_heights = np.where(rng.random(count) < 0.1, 205.0, heights[picks])
+    low, high = rng.uniform(0.7, 1.0, (2, count)), rng.uniform(1.0, 1.3, (2, count))
+    return query_heights, mrd[picks] * low[0], mrd[picks] * high[0], vrd[picks] * low[1], vrd[picks] * high[1]
+
+
+def brute_force(heights, mrd, vrd, windows):
+    pairs = set()
+    for query, (height, mrd_min, mrd_max, vrd_min, vrd_max) in enumerate(zip(*windows)):
+        matched = (heights == height) & (mrd >= mrd_min) & (mrd <= mrd_max) & (vrd >= vrd_min) & (vrd <= vrd_max)
+        pairs.update((query, row) for row in np.flatnonzero(matched))
+    return pairs
+
+
+@pytest.mark.parametrize("vendor", list(VENDORS))
+def test_range_join_matches_a_brute_force_filter(built, vendor):
+    rng = np.random.default_rng(1)
+    index = built.vendor_partitions[vendor]['25/30']
+    heights = index.frame[index.height_col].to_numpy(dtype=float)
+    mrd, vrd = index.frame[index.mrd_col].to_numpy(dtype=float), index.frame[index.vrd_col].to_numpy(dtype=float)
+    windows = random_windows(rng, heights, mrd, vrd)
+
+    query_ids, positions = range_join(index, *windows)
+    assert len(query_ids) > 0
+    assert len(set(zip(query_ids.tolist(), positions.tolist()))) == len(query_ids)
+    assert set(zip(query_ids.tolist(), positions.tolist())) == brute_force(heights, mrd, vrd, windows)
+
+
+# The unified index of a class returns, per vendor, the rows of that vendor's
+# frame in the class that a per-row filter of the frame selects
+def test_search_windows_matches_a_brute_force_filter(built):
+    rng = np.random.default_rng(2)
+    for concrete_class in built.concrete_classes:
+        frames = {key: frame[frame['c'] == concrete_class] for key, frame in built.frames.items()}
+        columns = {key: [frame[column].to_numpy(dtype=float, na_value=np.nan) for column in VENDORS[key].index_columns]
+                   for key, frame in frames.items()}
+        windows = random_windows(rng, *(np.concatenate(values) for values in zip(*columns.values())))
+
+        matches = built.search_windows(concrete_class, *windows)
+        for key, (query_ids, rows) in matches.items():
+            found = set(zip(query_ids.tolist(), rows.index.tolist()))
+            expected = {(query, frames[key].index[row]) for query, row in brute_force(*columns[key], windows)}
+            assert found == expected
+            assert rows.equals(built.frames[key].loc[rows.index])
+
+
+def pareto_reference(mrd, vrd):
+    return np.array([not any(m <= mrd[i] and v <= vrd[i] and (m < mrd[i] or v < vrd[i]) for m, v in zip(mrd, vrd))
+                     for i in range(len(mrd))])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_pareto_front_matches_the_quadratic_reference(seed):
+    rng = np.random.default_rng(seed)
+    # Small integer ranges, so ties and exact duplicates are frequent
+    mrd, vrd = rng.integers(0, 12, (2, 200)).astype(float)
+    assert np.array_equal(pareto_front(mrd, vrd), pareto_reference(mrd, vrd))
+
+
+def test_pareto_front_edge_cases():
+    assert pareto_front([], []).tolist() == []
+    assert pareto_front([1.0], [1.0]).tolist() == [True]
+    assert pareto_front([2.0, 2.0, 1.0], [1.0, 1.0, 3.0]).tolist() == [True, True, True]
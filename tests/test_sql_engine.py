@@ -0,0 +1,50 @@
+import pytest
+
+from sql_engine import NORMALIZED_TABLE, check_parity, get_sql_catalog, materialize_catalog
+
+LEVIAT_TABLE = "final_file_extended_columns_HIT_HP"
+
+
+def test_sql_and_memory_results_match(db):
+    materialize_catalog(db)
+    checks, mismatches = check_parity(db, windows=60)
+    assert checks > 0
+    assert mismatches == []
+
+
+def test_unbuilt_table_raises(db):
+    with pytest.raises(RuntimeError, match="has not been built"):
+        get_sql_catalog(db)
+    with pytest.raises(SystemExit):
+        check_parity(db, windows=1)
+
+
+@pytest.mark.parametrize("statement", [
+    f"UPDATE {LEVIAT_TABLE} SET vRd_plus = vRd_plus + 5 WHERE rowid <= 30",
+    f"DELETE FROM {LEVIAT_TABLE} WHERE rowid <= 3",
+    f"INSERT INTO {LEVIAT_TABLE} SELECT * FROM {LEVIAT_TABLE} LIMIT 2",
+])
+def test_changed_vendor_table_raises_until_rebuilt(db, modify, statement):
+    materialize_catalog(db)
+    assert get_sql_catalog(db) is get_sql_catalog(db)
+    modify(db, statement)
+    with pytest.raises(RuntimeError, match="changed since it was built"):
+        get_sql_catalog(db)
+    materialize_catalog(db)
+    assert get_sql_catalog(db).table_hashes
+
+
+# A recreated table has no change triggers; a renamed one takes them along
+@pytest.mark.parametrize("statements", [
+    [f"CREATE TABLE replaced AS SELECT * FROM {LEVIAT_TABLE}", f"DROP TABLE {LEVIAT_TABLE}",
+     f"CREATE TABLE {LEVIAT_TABLE} AS SELECT * FROM replaced"],
+    [f"ALTER TABLE {LEVIAT_TABLE} RENAME TO replaced", f"CREATE TABLE {LEVIAT_TABLE} AS SELECT * FROM replaced"],
+])
+def test_replaced_vendor_table_raises(db, modify, statements):
+    materialize_catalog(db)
+    for statement in statements:
+        modify(db, statement)
+    with pytest.raises(RuntimeError, match="replaced since it was built"):
+        get_sql_catalog(db)
+    with pytest.raises(SystemExit, match=NORMALIZED_TABLE):
+        check_parity(db, windows=1)